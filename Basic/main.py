@@ -1,19 +1,37 @@
 import hashlib
 import time
 import random
+from fixed_base import FixedBaseTable
 
 class ChameleonHash:
-    def __init__(self, g, h, p, secret_key):
+    def __init__(self, g, h, p, secret_key, q=None, precompute=False, window=6):
         self.g = g  # Generator g
-        self.h = h  # Generator h
+        self.h = h  # Generator h = g^secret_key
         self.p = p  # Large prime number for the cyclic group
+        self.q = q or p - 1  # Prime order of the subgroup generated by g and h
         self.secret_key = secret_key  # Secret key (trapdoor)
+        self.g_table = None  # Fixed-base tables, built by precompute()
+        self.h_table = None
+        if precompute:
+            self.precompute(window)
+
+    def precompute(self, window=6):
+        """
+        Build fixed-base exponentiation tables for g and h. Worth it once many
+        hashes are computed with the same parameters, e.g. on chain validation.
+        """
+        exponent_bits = self.q.bit_length()
+        self.g_table = FixedBaseTable(self.g, self.p, exponent_bits, window)
+        self.h_table = FixedBaseTable(self.h, self.p, exponent_bits, window)
     
     def hash(self, data, r):
         """
         Compute the Chameleon Hash using the provided data and randomness r.
         H(data, r) = g^data * h^r (mod p)
         """
+        if self.g_table is not None:
+            # Exponents can be reduced mod q since g and h have order q
+            return self.g_table.pow_product(data % self.q, self.h_table, r % self.q)
         g_pow_data = pow(self.g, data, self.p)
         h_pow_r = pow(self.h, r, self.p)
         return (g_pow_data * h_pow_r) % self.p
@@ -23,18 +41,21 @@ class ChameleonHash:
         Given the old data, new data, and old randomness r, find new randomness r'
         that keeps the hash unchanged using the secret key (trapdoor).
         """
-        delta_data = new_data - old_data
-        inverse_secret = pow(self.secret_key, -1, self.p - 1)  # secret_key^-1 mod (p-1)
-        r_prime = (old_r + (delta_data * inverse_secret) % (self.p - 1)) % (self.p - 1)
+        # h = g^x, so g^m * h^r = g^(m + x*r) and r' = r + (m - m') / x (mod q)
+        delta_data = old_data - new_data
+        inverse_secret = pow(self.secret_key, -1, self.q)  # secret_key^-1 mod q
+        r_prime = (old_r + delta_data * inverse_secret) % self.q
         return r_prime
 
 class Block:
+    __slots__ = ("index", "previous_hash", "data", "chameleon_hash", "r", "timestamp", "hash")
+
     def __init__(self, index, previous_hash, data, chameleon_hash, r=None, timestamp=None):
         self.index = index
         self.previous_hash = previous_hash
         self.data = data
         self.chameleon_hash = chameleon_hash
-        self.r = r or random.randint(1, chameleon_hash.p - 1)  # Random value for CHF
+        self.r = r or random.randint(1, chameleon_hash.q - 1)  # Random value for CHF
         self.timestamp = timestamp or time.time()
         self.hash = self.compute_chameleon_hash()
 
@@ -67,7 +88,7 @@ class Blockchain:
         self.create_genesis_block()
 
     def create_genesis_block(self):
-        genesis_block = Block(0, "0", 0, self.chameleon_hash, random.randint(1, self.chameleon_hash.p - 1))
+        genesis_block = Block(0, "0", 0, self.chameleon_hash, random.randint(1, self.chameleon_hash.q - 1))
         self.chain.append(genesis_block)
 
     def get_last_block(self):
@@ -109,13 +130,14 @@ class Blockchain:
         
 
 # Define group parameters for the Chameleon Hash
-g = 2
-h = 5
-p = 101  # A small prime for simplicity
+p = 107  # A small safe prime for simplicity, p = 2q + 1
+q = 53  # Prime order of the subgroup of quadratic residues
+g = 4  # Generator of that subgroup
 secret_key = 45  # Admin secret key
+h = pow(g, secret_key, p)  # h = g^secret_key so the trapdoor can find collisions
 
 # Initialize the Chameleon Hash function
-chf = ChameleonHash(g, h, p, secret_key)
+chf = ChameleonHash(g, h, p, secret_key, q)
 
 # Create a new blockchain using Chameleon Hash
 blockchain = Blockchain(chf)
@@ -2,6 +2,8 @@ import hashlib
 import time
 
 class Block:
+    __slots__ = ("index", "previous_hash", "data", "timestamp", "nonce", "hash")
+
     def __init__(self, index, previous_hash, data, timestamp=None):
         self.index = index                   # Block number
         self.previous_hash = previous_hash   # Hash of the previous block
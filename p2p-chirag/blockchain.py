@@ -1,43 +1,155 @@
 import hashlib
 import time
+from collections import deque
+
+MAX_TARGET = 1 << 256
+GENESIS_TIMESTAMP = 1700000000.0  # Fixed so every node starts from the same genesis block
+MEDIAN_TIME_BLOCKS = 11  # A block must be later than the median timestamp of this many blocks before it
+MAX_FUTURE_DRIFT = 120.0  # Seconds a block's timestamp may run ahead of our clock
+
+def target_from_bits(bits):
+    return MAX_TARGET >> bits
+
+def hash_meets_target(block_hash, target):
+    return int(block_hash, 16) < target
+
+def block_work(target):
+    """
+    Expected number of hashes needed to find a block below target.
+    """
+    return MAX_TARGET // target
+
+def recent_timestamps(chain, height):
+    """
+    Timestamps of the (up to MEDIAN_TIME_BLOCKS) blocks below `height`, as a
+    bounded deque a validation loop extends block by block.
+    """
+    return deque((chain[previous].timestamp for previous in range(max(height - MEDIAN_TIME_BLOCKS, 0), height)),
+                 maxlen=MEDIAN_TIME_BLOCKS)
+
+def timestamp_is_valid(timestamp, recent, now=None):
+    """
+    A block's timestamp must be later than the median of `recent` and at most
+    MAX_FUTURE_DRIFT seconds ahead of our clock, so it cannot be set freely to
+    ease the next retarget.
+    """
+    ordered = sorted(recent)
+    now = time.time() if now is None else now
+    return ordered[len(ordered) // 2] < timestamp <= now + MAX_FUTURE_DRIFT
 
 class Block:
-    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0):
+    __slots__ = ("index", "previous_hash", "data", "timestamp", "nonce", "target", "hash")
+
+    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0, target=MAX_TARGET, hash=None):
         self.index = index
         self.previous_hash = previous_hash
         self.data = data
         self.timestamp = timestamp or time.time()
         self.nonce = nonce
-        self.hash = self.compute_hash()
+        self.target = target
+        self.hash = hash if hash is not None else self.compute_hash()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def hash_prefix(self):
+        return f"{self.index}{self.previous_hash}{self.data}{self.timestamp}{self.target}"
+
+    def midstate(self):
+        return hashlib.sha256(self.hash_prefix().encode())
 
     def compute_hash(self):
-        block_string = f"{self.index}{self.previous_hash}{self.data}{self.timestamp}{self.nonce}"
+        block_string = f"{self.hash_prefix()}{self.nonce}"
         return hashlib.sha256(block_string.encode()).hexdigest()
 
-    def mine_block(self, difficulty):
-        target = '0' * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.compute_hash()
+    def mine_block(self, target, miner=None):
+        if miner is not None:
+            self.nonce, self.hash = miner.mine(self, target)
+            return
+        midstate = self.midstate()
+        nonce = self.nonce
+        while True:
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            if int.from_bytes(attempt.digest(), 'big') < target:
+                break
+            nonce += 1
+        self.nonce = nonce
+        self.hash = attempt.hexdigest()
+
+class ForkView:
+    def __init__(self, chain, fork_height, suffix):
+        """
+        Read-only view of chain[:fork_height] followed by a candidate suffix, so
+        the suffix can be validated (retargeting included) without copying the
+        shared prefix.
+        """
+        self.chain = chain
+        self.fork_height = fork_height
+        self.suffix = suffix
+
+    def __len__(self):
+        return self.fork_height + len(self.suffix)
+
+    def __getitem__(self, height):
+        if height < 0:
+            height += len(self)
+        if height < self.fork_height:
+            return self.chain[height]
+        return self.suffix[height - self.fork_height]
 
 class Blockchain:
-    def __init__(self, difficulty):
-        self.chain = [self.create_genesis_block()]
+    def __init__(self, difficulty, miner=None, target=None, retargeter=None):
         self.difficulty = difficulty
+        self.target = target or target_from_bits(4 * difficulty)  # Initial bit-granular 256-bit target
+        self.retargeter = retargeter  # Optional retarget.Retargeter, otherwise the target is fixed
+        self.chain = [self.create_genesis_block()]
+        self.miner = miner  # Optional parallel nonce search engine
 
     def create_genesis_block(self):
-        return Block(0, "0", "Genesis Block", time.time())
+        return Block(0, "0", "Genesis Block", GENESIS_TIMESTAMP, target=self.target)
 
     def get_last_block(self):
         return self.chain[-1]
 
+    def expected_target(self, height, chain=None):
+        if self.retargeter is None or height == 0:
+            return self.target
+        return self.retargeter.next_target(self.chain if chain is None else chain, height)
+
+    def next_target(self):
+        return self.expected_target(len(self.chain))
+
     def add_block(self, data):
         previous_block = self.get_last_block()
-        new_block = Block(len(self.chain), previous_block.hash, data)
-        new_block.mine_block(self.difficulty)
+        new_block = Block(len(self.chain), previous_block.hash, data, target=self.next_target())
+        new_block.mine_block(new_block.target, self.miner)
         self.chain.append(new_block)
 
+    def add_received_block(self, block):
+        """
+        Validate a block mined by a peer as our next block (height, link, target,
+        timestamp, hash and proof of work) and append it. Returns False if it does not fit.
+        """
+        height = len(self.chain)
+        if (block.index != height or block.previous_hash != self.get_last_block().hash or
+                block.target != self.expected_target(height) or
+                not timestamp_is_valid(block.timestamp, recent_timestamps(self.chain, height)) or
+                block.hash != block.compute_hash() or
+                not hash_meets_target(block.hash, block.target)):
+            return False
+        self.chain.append(block)
+        return True
+
+    def append_verified(self, block):
+        """
+        Append a block that was already checked, e.g. by InitialSync against its header chain.
+        """
+        self.chain.append(block)
+
     def is_chain_valid(self):
+        recent = recent_timestamps(self.chain, 1)
+        now = time.time()
         for i in range(1, len(self.chain)):
             current_block = self.chain[i]
             previous_block = self.chain[i - 1]
@@ -46,4 +158,7 @@ class Blockchain:
                 return False
             if current_block.previous_hash != previous_block.hash:
                 return False
+            if not timestamp_is_valid(current_block.timestamp, recent, now):
+                return False
+            recent.append(current_block.timestamp)
         return True
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import OrderedDict
+
+from wire import MSG_GETDATA, MSG_INV, encode_message
+
+
+class SeenCache:
+    def __init__(self, capacity):
+        """
+        Bounded set of item keys that forgets the least recently used key when full.
+        """
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, key, value=None):
+        """
+        Remember key (with an optional value); returns True if it was not known yet.
+        """
+        new = key not in self.items
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        return new
+
+    def get(self, key):
+        return self.items.get(key)
+
+    def oldest(self):
+        """
+        Return the least recently added (key, value) pair, or None when empty.
+        """
+        return next(iter(self.items.items()), None)
+
+    def discard(self, key):
+        self.items.pop(key, None)
+
+
+class Gossip:
+    def __init__(self, pool, capacity=100000, peer_capacity=20000, store_capacity=5000, request_timeout=5.0,
+                 max_announcers=8):
+        """
+        inv/getdata relay: new items are announced by (type, hash) and only sent
+        in full to peers that ask for them. `seen` holds every item this node
+        has received and `requested` the ones asked for but not yet received, so
+        nothing is fetched twice, and each peer has a cache of the items it is
+        known to have, so nothing is announced to it twice. Items are keyed by
+        (type, 32-byte hash).
+
+        A request that is not answered within `request_timeout` seconds is sent
+        again to the next peer that announced the item (up to `max_announcers`
+        are remembered), see retry_expired().
+        """
+        self.pool = pool
+        self.seen = SeenCache(capacity)
+        self.requested = SeenCache(peer_capacity)  # item -> [deadline, asked peer, other announcers]
+        self.request_timeout = request_timeout
+        self.max_announcers = max_announcers
+        self.known = {}  # peer address -> SeenCache of items the peer already has
+        self.peer_capacity = peer_capacity
+        self.store = SeenCache(store_capacity)  # Encoded messages of recent items, to answer getdata
+        self.lock = threading.Lock()
+
+    def _known(self, peer):
+        if peer not in self.known:
+            self.known[peer] = SeenCache(self.peer_capacity)
+        return self.known[peer]
+
+    def receive(self, peer, item):
+        """
+        Record an item that arrived in full; returns True if this node had not seen it before.
+        """
+        with self.lock:
+            if peer is not None:
+                self._known(peer).add(item)
+            self.requested.discard(item)
+            return self.seen.add(item)
+
+    def announce(self, item, message, peers):
+        """
+        Keep the item's message for getdata and send an inv to every peer not known to have it.
+        """
+        with self.lock:
+            self.seen.add(item)
+            self.store.add(item, message)
+            targets = [peer for peer in peers if self._known(peer).add(item)]
+        if targets:
+            self.pool.relay(encode_message(MSG_INV, [item]), targets)
+
+    def on_inv(self, peer, items):
+        """
+        Request the announced items this node has neither seen nor requested
+        yet. A peer announcing an item that is already requested from another
+        peer is remembered as a fallback for that request.
+        """
+        deadline = time.monotonic() + self.request_timeout
+        with self.lock:
+            known = self._known(peer)
+            wanted = []
+            for item in items:
+                known.add(item)
+                if item in self.seen:
+                    continue
+                request = self.requested.get(item)
+                if request is None:
+                    self.requested.add(item, [deadline, peer, []])
+                    wanted.append(item)
+                elif peer != request[1] and peer not in request[2] and len(request[2]) < self.max_announcers:
+                    request[2].append(peer)
+        if wanted:
+            self.pool.relay(encode_message(MSG_GETDATA, wanted), [peer])
+
+    def retry_expired(self):
+        """
+        Send every request that passed its deadline again to the next peer that
+        announced the item. A request with no other announcer is forgotten, so
+        the next inv for the item starts a new one. Returns the number of items
+        requested again.
+        """
+        now = time.monotonic()
+        retries = {}  # peer -> items
+        with self.lock:
+            # Requests stay in deadline order: every request is added at the end and never refreshed
+            while True:
+                oldest = self.requested.oldest()
+                if oldest is None or oldest[1][0] > now:
+                    break
+                item, (_, _, announcers) = oldest
+                self.requested.discard(item)
+                if announcers:
+                    peer = announcers.pop(0)
+                    self.requested.add(item, [now + self.request_timeout, peer, announcers])
+                    retries.setdefault(peer, []).append(item)
+        for peer, items in retries.items():
+            self.pool.relay(encode_message(MSG_GETDATA, items), [peer])
+        return sum(len(items) for items in retries.values())
+
+    def on_getdata(self, peer, items):
+        """
+        Send the requested items that are still in the store.
+        """
+        with self.lock:
+            messages = [self.store.get(item) for item in items if item in self.store]
+            known = self._known(peer)
+            for item in items:
+                known.add(item)
+        for message in messages:
+            self.pool.relay(message, [peer])
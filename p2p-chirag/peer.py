@@ -0,0 +1,238 @@
+import queue
+import socket
+import struct
+import threading
+import time
+
+# Every message on a peer connection is a 4-byte big-endian length followed by the payload
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 32 * 1024 * 1024
+
+
+def send_frame(sock, payload):
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_exactly(sock, size):
+    """
+    Reads exactly `size` bytes, or returns None if the peer closed the connection first.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+def recv_frame(sock):
+    """
+    Reads one framed message, or returns None when the connection is closed.
+    """
+    header = recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    length, = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit.")
+    return recv_exactly(sock, length)
+
+
+class PeerConnection:
+    def __init__(self, address, timeout=5.0, min_backoff=0.5, max_backoff=30.0, hello=None, max_queued=1000):
+        """
+        Long-lived connection to one peer. It is opened on first use and, after a
+        failure, reopened no earlier than an exponentially growing backoff delay.
+        `hello` is sent as the first frame of every new connection. Messages
+        passed to post() wait in an outbox of at most `max_queued` messages.
+        """
+        self.address = address
+        self.hello = hello
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.sock = None
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self.lock = threading.Lock()  # One writer at a time so frames never interleave
+        self.outbox = queue.Queue(max_queued)
+        self.sender = None  # Thread draining the outbox, started by the first post()
+        self.sender_lock = threading.Lock()
+
+    def connect(self):
+        if time.monotonic() < self.retry_at:
+            raise ConnectionError(f"Peer {self.address} is backing off for {self.retry_at - time.monotonic():.1f}s.")
+        try:
+            self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.hello is not None:
+                send_frame(self.sock, self.hello)
+        except OSError:
+            self.close_socket()
+            self.backoff = min(max(self.backoff * 2, self.min_backoff), self.max_backoff)
+            self.retry_at = time.monotonic() + self.backoff
+            raise
+        self.backoff = 0.0
+
+    def open(self):
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+
+    def send(self, payload):
+        """
+        Sends one framed message. A connection that went stale while idle is
+        reopened and the message retried once before the error is raised.
+        """
+        with self.lock:
+            for attempt in range(2):
+                if self.sock is None:
+                    self.connect()
+                try:
+                    send_frame(self.sock, payload)
+                    return
+                except OSError:
+                    self.close_socket()
+                    if attempt:
+                        raise
+
+    def post(self, payload):
+        """
+        Queues one framed message for the connection's sender thread and returns
+        at once, so a slow or unreachable peer never holds up the caller (e.g.
+        the event loop). Returns False if the outbox is full and the message was dropped.
+        """
+        with self.sender_lock:
+            if self.sender is None:
+                self.sender = threading.Thread(target=self.drain_outbox, daemon=True)
+                self.sender.start()
+        try:
+            self.outbox.put_nowait(payload)
+            return True
+        except queue.Full:
+            return False
+
+    def drain_outbox(self):
+        while True:
+            payload = self.outbox.get()
+            if payload is None:
+                return
+            try:
+                self.send(payload)
+            except OSError as e:
+                print(f"Error sending message to peer {self.address}: {e}")
+
+    def close_socket(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def close(self):
+        with self.sender_lock:
+            if self.sender is not None:
+                # Drop what is still queued and stop the sender thread
+                while True:
+                    try:
+                        self.outbox.get_nowait()
+                    except queue.Empty:
+                        break
+                self.outbox.put_nowait(None)
+                self.sender = None
+        with self.lock:
+            self.close_socket()
+
+
+class ConnectionPool:
+    def __init__(self, **options):
+        """
+        One PeerConnection per peer address, shared by every sender on the node.
+        """
+        self.options = options
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def get(self, address):
+        with self.lock:
+            if address not in self.connections:
+                self.connections[address] = PeerConnection(address, **self.options)
+            return self.connections[address]
+
+    def send(self, address, payload):
+        self.get(address).send(payload)
+
+    def broadcast(self, payload, addresses=None):
+        """
+        Sends to every pooled peer (or the given addresses), returning the addresses that failed.
+        """
+        failed = []
+        for address in list(self.connections) if addresses is None else addresses:
+            try:
+                self.send(address, payload)
+            except OSError as e:
+                print(f"Error sending message to peer {address}: {e}")
+                failed.append(address)
+        return failed
+
+    def relay(self, payload, addresses=None):
+        """
+        Queues a message for every pooled peer (or the given addresses) without
+        waiting on any of them, returning the addresses whose outbox was full.
+        """
+        return [address for address in (list(self.connections) if addresses is None else addresses)
+                if not self.get(address).post(payload)]
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections = {}
+
+
+def benchmark(messages=5000, size=200):
+    """
+    Sends `messages` payloads to a local listener, once opening a new
+    connection per message (the old send_to_peers behaviour) and once over a
+    pooled framed connection, and reports messages/sec for each.
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+    address = server.getsockname()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:  # Listener closed at the end of the benchmark
+                return
+            threading.Thread(target=drain, args=(conn,), daemon=True).start()
+
+    def drain(conn):
+        with conn:
+            while conn.recv(65536):
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    payload = b"x" * size
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        with socket.create_connection(address) as sock:
+            sock.sendall(payload)
+    per_message = messages / (time.perf_counter() - start)
+
+    pool = ConnectionPool()
+    start = time.perf_counter()
+    for _ in range(messages):
+        pool.send(address, payload)
+    pooled = messages / (time.perf_counter() - start)
+    pool.close()
+    server.close()
+
+    print(f"connect per message: {per_message:,.0f} msg/s | pooled framed: {pooled:,.0f} msg/s "
+          f"| x{pooled / per_message:.1f}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,34 @@
+from fractions import Fraction
+
+from blockchain import MAX_TARGET
+
+
+class Retargeter:
+    def __init__(self, block_time=10.0, interval=10, max_adjustment=4):
+        self.block_time = block_time          # Desired seconds between blocks
+        self.interval = interval              # Blocks between target adjustments
+        self.max_adjustment = max_adjustment  # Largest factor the target may move by at once
+
+    def next_target(self, chain, height):
+        """
+        Returns the target the block at `height` must carry, given chain[:height].
+        The target only changes on multiples of `interval`; it is then scaled by
+        how long the last `interval` blocks actually took versus block_time.
+        """
+        previous_block = chain[height - 1]
+        if height % self.interval != 0:
+            return previous_block.target
+
+        # The genesis timestamp is fixed in the past, so the first window starts at height 1
+        first = max(height - self.interval, 1)
+        if first >= height - 1:
+            return previous_block.target
+        first_block = chain[first]
+        expected = Fraction(self.block_time) * (previous_block.index - first_block.index)
+        actual = Fraction(previous_block.timestamp - first_block.timestamp)
+
+        # Clamp so a few bogus timestamps cannot swing the difficulty arbitrarily
+        actual = min(max(actual, expected / self.max_adjustment), expected * self.max_adjustment)
+
+        target = previous_block.target * actual / expected
+        return max(1, min(int(target), MAX_TARGET - 1))
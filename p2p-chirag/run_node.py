@@ -1,8 +1,11 @@
 from blockchain import Blockchain
+from miner import ParallelMiner
 from node import Node
+from retarget import Retargeter
 
 def run_node(host, port, peer_host=None, peer_port=None):
-    blockchain = Blockchain(difficulty=2)
+    blockchain = Blockchain(difficulty=2, miner=ParallelMiner(),
+                            retargeter=Retargeter(block_time=10.0, interval=10))
     node = Node(host, port, blockchain)
     
     # Start node server
@@ -11,6 +14,7 @@ def run_node(host, port, peer_host=None, peer_port=None):
     # Optionally connect to a peer node
     if peer_host and peer_port:
         node.connect_to_peer(peer_host, peer_port)
+        node.sync()  # Catch up on the peer's chain before mining on top of it
 
 if __name__ == "__main__":
     import sys
@@ -1,37 +1,178 @@
 import hashlib
+import struct
 import time
+from collections import deque
+import wire  # Module import: blockchain -> mempool -> wire is a cycle
+from checkpoint import ValidationCheckpoint
+from mempool import MAX_BLOCK_TRANSACTIONS, Mempool
+from store import BlockStore, StoredChain
+
+MAX_TARGET = 1 << 256
+GENESIS_TIMESTAMP = 1700000000.0  # Fixed so every node starts from the same genesis block
+MEDIAN_TIME_BLOCKS = 11  # A block must be later than the median timestamp of this many blocks before it
+MAX_FUTURE_DRIFT = 120.0  # Seconds a block's timestamp may run ahead of our clock
+
+def target_from_bits(bits):
+    return MAX_TARGET >> bits
+
+def hash_meets_target(block_hash, target):
+    return int(block_hash, 16) < target
+
+def block_work(target):
+    """
+    Expected number of hashes needed to find a block below target.
+    """
+    return MAX_TARGET // target
+
+def recent_timestamps(chain, height):
+    """
+    Timestamps of the (up to MEDIAN_TIME_BLOCKS) blocks below `height`, as a
+    bounded deque a validation loop extends block by block.
+    """
+    return deque((chain[previous].timestamp for previous in range(max(height - MEDIAN_TIME_BLOCKS, 0), height)),
+                 maxlen=MEDIAN_TIME_BLOCKS)
+
+def timestamp_is_valid(timestamp, recent, now=None):
+    """
+    A block's timestamp must be later than the median of `recent` and at most
+    MAX_FUTURE_DRIFT seconds ahead of our clock, so it cannot be set freely to
+    ease the next retarget.
+    """
+    ordered = sorted(recent)
+    now = time.time() if now is None else now
+    return ordered[len(ordered) // 2] < timestamp <= now + MAX_FUTURE_DRIFT
 
 class Block:
-    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0):
+    __slots__ = ("index", "previous_hash", "data", "timestamp", "nonce", "target", "hash")
+
+    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0, target=MAX_TARGET, hash=None):
         self.index = index
         self.previous_hash = previous_hash
         self.data = data
         self.timestamp = timestamp or time.time()
         self.nonce = nonce
-        self.hash = self.compute_hash()
+        self.target = target
+        self.hash = hash if hash is not None else self.compute_hash()
+
+    def serialize(self):
+        """
+        Encode the block for the block store: a format version byte, then the wire encoding.
+        """
+        out = bytearray([wire.VERSION])
+        wire.encode_block(self, out)
+        return bytes(out)
+
+    @classmethod
+    def deserialize(cls, record):
+        if not record or record[0] != wire.VERSION:
+            raise ValueError("Unsupported block record version.")
+        try:
+            block, offset = wire.decode_block(record, 1)
+        except (IndexError, struct.error) as e:
+            raise ValueError(f"Corrupt block record: {e}")
+        if offset != len(record):
+            raise ValueError("Trailing bytes after block record.")
+        return block
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def hash_prefix(self):
+        return f"{self.index}{self.previous_hash}{self.data}{self.timestamp}{self.target}"
+
+    def midstate(self):
+        return hashlib.sha256(self.hash_prefix().encode())
 
     def compute_hash(self):
-        block_string = f"{self.index}{self.previous_hash}{self.data}{self.timestamp}{self.nonce}"
+        block_string = f"{self.hash_prefix()}{self.nonce}"
         return hashlib.sha256(block_string.encode()).hexdigest()
 
-    def mine_block(self, difficulty):
-        target = '0' * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.compute_hash()
+    def mine_block(self, target, miner=None):
+        if miner is not None:
+            self.nonce, self.hash = miner.mine(self, target)
+            return
+        midstate = self.midstate()
+        nonce = self.nonce
+        while True:
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            if int.from_bytes(attempt.digest(), 'big') < target:
+                break
+            nonce += 1
+        self.nonce = nonce
+        self.hash = attempt.hexdigest()
+
+class ForkView:
+    def __init__(self, chain, fork_height, suffix):
+        """
+        Read-only view of chain[:fork_height] followed by a candidate suffix, so
+        the suffix can be validated (retargeting included) without copying the
+        shared prefix.
+        """
+        self.chain = chain
+        self.fork_height = fork_height
+        self.suffix = suffix
+
+    def __len__(self):
+        return self.fork_height + len(self.suffix)
+
+    def __getitem__(self, height):
+        if height < 0:
+            height += len(self)
+        if height < self.fork_height:
+            return self.chain[height]
+        return self.suffix[height - self.fork_height]
 
 class Blockchain:
-    def __init__(self, difficulty):
-        self.chain = [self.create_genesis_block()]
+    def __init__(self, difficulty, miner=None, target=None, retargeter=None, store_path=None, validator=None,
+                 max_block_transactions=MAX_BLOCK_TRANSACTIONS):
         self.difficulty = difficulty
-        self.unconfirmed_transactions = []  
+        self.target = target or target_from_bits(4 * difficulty)  # Initial bit-granular 256-bit target
+        self.retargeter = retargeter  # Optional retarget.Retargeter, otherwise the target is fixed
+        if store_path is None:
+            self.chain = [self.create_genesis_block()]
+        else:
+            # Blocks live in an append-only store on disk, so a restarted node keeps its chain
+            self.chain = StoredChain(BlockStore(store_path, Block.serialize, Block.deserialize))
+            if not len(self.chain):
+                self.chain.append(self.create_genesis_block())
+        self.miner = miner  # Optional parallel nonce search engine
+        self.validator = validator  # Optional validator.ParallelValidator for long ranges
+        self.checkpoint = ValidationCheckpoint()  # Highest verified height of self.chain
+        self._heights = {}  # Hash -> height for an in-memory chain, filled in by height_of()
+        self._indexed = 0
+        self.unconfirmed_transactions = Mempool()  # Deduplicated, fee-ordered, size-capped
+        self.max_block_transactions = max_block_transactions  # Highest-fee transactions a new block takes
 
     def create_genesis_block(self):
-        return Block(0, "0", "Genesis Block", time.time())
+        return Block(0, "0", "Genesis Block", GENESIS_TIMESTAMP, target=self.target)
 
     def get_last_block(self):
         return self.chain[-1]
 
+    def height_of(self, block_hash):
+        """
+        Return the height of the block with this hash in our chain, or None.
+        """
+        if isinstance(self.chain, StoredChain):
+            return self.chain.store.height_of(block_hash)
+        for height in range(self._indexed, len(self.chain)):
+            self._heights[self.chain[height].hash] = height
+        self._indexed = len(self.chain)
+        return self._heights.get(block_hash)
+
+    def get_block_by_hash(self, block_hash):
+        height = self.height_of(block_hash)
+        return None if height is None else self.chain[height]
+
+    def expected_target(self, height, chain=None):
+        if self.retargeter is None or height == 0:
+            return self.target
+        return self.retargeter.next_target(self.chain if chain is None else chain, height)
+
+    def next_target(self):
+        return self.expected_target(len(self.chain))
+
     def add_block(self, block, proof):
         last_block = self.get_last_block()
         if last_block.hash != block.previous_hash:
@@ -41,39 +182,157 @@ class Blockchain:
             return False
 
         self.chain.append(block)
+        self.unconfirmed_transactions.remove_confirmed(block.data)
         return True
 
+    def append_verified(self, block):
+        """
+        Append a block that was already checked, e.g. by InitialSync against its
+        header chain, and drop its transactions from the pool.
+        """
+        self.chain.append(block)
+        self.unconfirmed_transactions.remove_confirmed(block.data)
+
+    def create_new_block(self, last_block):
+        # Transactions stay pooled until the block is added
+        return Block(last_block.index + 1, last_block.hash,
+                     self.unconfirmed_transactions.select(self.max_block_transactions),
+                     target=self.next_target())
+
     def proof_of_work(self, block):
-        block.mine_block(self.difficulty)
+        block.mine_block(block.target, self.miner)
         return block.hash
 
     def is_valid_proof(self, block, block_hash):
-        return block_hash.startswith('0' * self.difficulty) and block_hash == block.compute_hash()
+        # Checked as the next block: its claimed index must not pick an easier height's target
+        height = len(self.chain)
+        return (block.index == height and
+                block.target == self.expected_target(height) and
+                timestamp_is_valid(block.timestamp, recent_timestamps(self.chain, height)) and
+                hash_meets_target(block_hash, block.target) and
+                block_hash == block.compute_hash())
 
-    def is_chain_valid(self):
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
+    def is_chain_valid(self, chain=None):
+        """
+        Validate our own chain, resuming from the verified-height checkpoint, or
+        a candidate chain from scratch.
+        """
+        if chain is not None and chain is not self.chain:
+            return self.find_invalid_block(chain) is None
+
+        start = self.checkpoint.resume_height(self.chain)
+        invalid, end, tip_hash = self._check_chain(self.chain, start)
+        if invalid is not None:
+            return False
+        self.checkpoint.advance(end, tip_hash)
+        return True
+
+    def find_invalid_block(self, chain, start=1):
+        """
+        Return the height of the first block in chain[start:] with a wrong hash,
+        target, timestamp, proof of work or link, or None. Targets are checked against the
+        ones expected for each height, from a genesis block with our initial
+        target. With a validator the range is checked in parallel shards.
+        """
+        return self._check_chain(chain, start)[0]
 
+    def _check_chain(self, chain, start=1):
+        """
+        Validate chain[start:end] for the chain's current length `end` and
+        return (first invalid height or None, end, hash of chain[end - 1]).
+        """
+        end = len(chain)
+        if start <= 1 and chain[0].target != self.target:
+            return 0, end, None
+        start = max(start, 1)
+        if self.validator is not None:
+            invalid = self.validator.find_invalid_block(chain, start, self.target, self.retargeter, end)
+            # The workers hashed the blocks; only the tip is read back for its hash
+            return invalid, end, chain[end - 1].hash if invalid is None else None
+        previous_block = chain[start - 1]
+        recent = recent_timestamps(chain, start)
+        now = time.time()
+        # Walk the chain once so a stored chain decodes every block a single time
+        for height in range(start, end):
+            current_block = chain[height]
             if current_block.hash != current_block.compute_hash():
-                return False
+                return height, end, None
+            if current_block.target != self.expected_target(height, chain):
+                return height, end, None
+            if not timestamp_is_valid(current_block.timestamp, recent, now):
+                return height, end, None
+            recent.append(current_block.timestamp)
+            if not hash_meets_target(current_block.hash, current_block.target):
+                return height, end, None
             if current_block.previous_hash != previous_block.hash:
-                return False
-        return True
+                return height, end, None
+            previous_block = current_block
+        return None, end, previous_block.hash
 
-    def resolve_conflicts(self, chains):
+    def find_fork(self, headers):
         """
-        Simple consensus algorithm: Replace with the longest valid chain
+        Return (fork_height, suffix) for a candidate: the number of blocks it
+        shares with our chain and its blocks above them. The common ancestor is
+        found by walking back from the candidate's tip through the hash index, so
+        `headers` may be a whole chain or just its tip. None if it does not connect.
         """
-        longest_chain = None
-        max_length = len(self.chain)
+        for position in range(len(headers) - 1, -1, -1):
+            height = self.height_of(headers[position].hash)
+            if height is not None:
+                return (height + 1, headers[position + 1:]) if height == headers[position].index else None
+        if len(headers):
+            height = self.height_of(headers[0].previous_hash)
+            if height is not None and height + 1 == headers[0].index:
+                return height + 1, headers[:]
+        return None
 
-        for chain in chains:
-            if len(chain) > max_length and self.is_chain_valid(chain):
-                max_length = len(chain)
-                longest_chain = chain
+    def find_invalid_suffix(self, fork_height, suffix):
+        """
+        Return the height of the first invalid block of a candidate suffix, or None.
+        Checks heights, targets, proof of work, hashes and links against our prefix.
+        """
+        view = ForkView(self.chain, fork_height, suffix)
+        for height in range(fork_height, len(view)):
+            block = view[height]
+            if block.index != height or block.target != self.expected_target(height, view):
+                return height
+        return self.find_invalid_block(view, fork_height)
 
-        if longest_chain:
-            self.chain = longest_chain
-            return True
+    def resolve_conflicts(self, chains):
+        """
+        Header-first fork choice: adopt the candidate with the most cumulative
+        work. Only blocks above the common ancestor are compared and validated,
+        and our chain is rewound to the ancestor and extended in place.
+        """
+        candidates = []
+        for headers in chains:
+            fork = self.find_fork(headers)
+            if fork is None:
+                continue
+            fork_height, suffix = fork
+            # Work below the common ancestor is shared, so only the divergent parts are summed
+            extra_work = (sum(block_work(block.target) for block in suffix) -
+                          sum(block_work(block.target) for block in self.chain[fork_height:]))
+            if extra_work > 0:
+                candidates.append((extra_work, fork_height, suffix))
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        for _, fork_height, suffix in candidates:
+            if self.find_invalid_suffix(fork_height, suffix) is None:
+                self.switch_to_fork(fork_height, suffix)
+                return True
         return False
+
+    def switch_to_fork(self, fork_height, suffix):
+        """
+        Replace our blocks from fork_height on with a validated suffix, keeping the shared prefix.
+        """
+        for height in range(fork_height, min(self._indexed, len(self.chain))):
+            self._heights.pop(self.chain[height].hash, None)
+        self._indexed = min(self._indexed, fork_height)
+        del self.chain[fork_height:]
+        for block in suffix:
+            self.chain.append(block)
+            self.unconfirmed_transactions.remove_confirmed(block.data)
+        # Verification of our chain only carries over up to the fork point
+        self.checkpoint.invalidate(fork_height, self.chain[fork_height - 1].hash)
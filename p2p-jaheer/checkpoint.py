@@ -0,0 +1,39 @@
+class ValidationCheckpoint:
+    def __init__(self):
+        """
+        Remembers how much of a chain has already been validated, so later
+        validations only check blocks appended since. The hash of the last
+        verified block is kept to notice a chain that was swapped underneath.
+        """
+        self.reset()
+
+    def reset(self):
+        self.height = 0  # chain[:height] is verified
+        self.tip_hash = None  # Hash of chain[height - 1], to notice a swapped chain
+
+    def resume_height(self, chain):
+        """
+        Return the height validation can resume from. Starts over if the chain
+        no longer contains the last verified block at its height.
+        """
+        if self.height and (self.height > len(chain) or chain[self.height - 1].hash != self.tip_hash):
+            self.reset()
+        return self.height
+
+    def advance(self, height, tip_hash):
+        """
+        Record chain[:height] as verified, given the hash of chain[height - 1] that validation returned.
+        """
+        if height > self.height:
+            self.height = height
+            self.tip_hash = tip_hash
+
+    def invalidate(self, height, previous_hash):
+        """
+        Forget verification of every block at or above `height`, e.g. after a
+        redaction or a reorg touched that height. `previous_hash` is the hash of
+        chain[height - 1], which the change left in place.
+        """
+        if height < self.height:
+            self.height = height
+            self.tip_hash = previous_hash if height else None
@@ -1,48 +1,446 @@
 import hashlib
+import os
 import time
 import random
+import secrets
+from fixed_base import FixedBaseTable, multi_pow
+from wire import VERSION, decode_value, encode_value
+from checkpoint import ValidationCheckpoint
+from params import load_or_generate
+from store import BlockStore, StoredChain
+from txindex import TransactionIndex
+
+def feed_payload(digest, data):
+    """
+    Stream a block payload into a hashlib object with an unambiguous encoding
+    (type tag and length before every value), without building one big string.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        payload = memoryview(data).cast("B")
+        digest.update(b"b" + len(payload).to_bytes(8, "big"))
+        digest.update(payload)
+    elif isinstance(data, str):
+        payload = data.encode()
+        digest.update(b"s" + len(payload).to_bytes(8, "big"))
+        digest.update(payload)
+    elif isinstance(data, int):
+        payload = str(data).encode()
+        digest.update(b"i" + len(payload).to_bytes(8, "big"))
+        digest.update(payload)
+    elif isinstance(data, float):
+        payload = repr(data).encode()
+        digest.update(b"f" + len(payload).to_bytes(8, "big"))
+        digest.update(payload)
+    elif data is None:
+        digest.update(b"n")
+    elif isinstance(data, (list, tuple)):
+        digest.update(b"l" + len(data).to_bytes(8, "big"))
+        for item in data:
+            feed_payload(digest, item)
+    elif isinstance(data, dict):
+        digest.update(b"d" + len(data).to_bytes(8, "big"))
+        for key in sorted(data, key=str):
+            feed_payload(digest, key)
+            feed_payload(digest, data[key])
+    else:
+        raise TypeError(f"Unsupported block payload type: {type(data).__name__}")
+
+def jacobi(a, n):
+    """
+    Jacobi symbol (a/n) for odd n > 0, with the binary algorithm; no exponentiation needed.
+    """
+    a %= n
+    result = 1
+    while a:
+        while not a & 1:
+            a >>= 1
+            if n & 7 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+def payload_digest(data):
+    """
+    SHA-256 over the type-tagged encoding of a payload.
+    """
+    digest = hashlib.sha256()
+    feed_payload(digest, data)
+    return digest.digest()
+
+def transaction_id(transaction):
+    """
+    Content hash identifying a transaction, or a whole non-list payload, in the transaction index.
+    """
+    return payload_digest(transaction)
+
+def payload_ids(data):
+    """
+    Return the (position, transaction id) pairs of a block payload; position is None for a non-list payload.
+    """
+    if isinstance(data, list):
+        return [(position, transaction_id(transaction)) for position, transaction in enumerate(data)]
+    return [(None, transaction_id(data))]
+
+EMPTY_ROOT = hashlib.sha256(b"").digest()  # Merkle root of a block without transactions
+
+def merkle_leaf(chameleon_hash, transaction, r):
+    """
+    Leaf digest of a transaction: SHA-256 over its chameleon hash H(transaction, r),
+    so a trapdoor collision for one transaction leaves the leaf and the whole tree unchanged.
+    """
+    size = (chameleon_hash.p.bit_length() + 7) // 8
+    return hashlib.sha256(b"\x00" + chameleon_hash.hash(transaction, r).to_bytes(size, "big")).digest()
+
+def merkle_parent(left, right):
+    # Leaves and inner nodes are hashed with different prefixes so one cannot pass for the other
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def merkle_levels(leaves):
+    """
+    Build every level of the tree bottom-up, ending with [root]. An odd node
+    at the end of a level is carried up unchanged.
+    """
+    levels = [list(leaves) or [EMPTY_ROOT]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+def commit_count(count, tree_root):
+    """
+    Bind the number of transactions into the root, so leaves cannot be appended or dropped.
+    """
+    return hashlib.sha256(b"\x02" + count.to_bytes(8, "big") + tree_root).digest()
+
+def merkle_path(levels, position):
+    """
+    Return the siblings from leaf `position` up to the root as (sibling, sibling_is_left) pairs.
+    """
+    path = []
+    for level in levels[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            path.append((level[sibling], sibling < position))
+        position //= 2
+    return path
+
+def merkle_root_from_path(leaf, path):
+    node = leaf
+    for sibling, sibling_is_left in path:
+        node = merkle_parent(sibling, node) if sibling_is_left else merkle_parent(node, sibling)
+    return node
+
+def root_exponent(chameleon_hash, root):
+    """
+    Map a Merkle root into the exponent space of the block-level chameleon hash.
+    """
+    return int.from_bytes(root, "big") % chameleon_hash.q
+
+def verify_inclusion(chameleon_hash, transaction, proof, root, block_r, block_hash):
+    """
+    Light-client check that `transaction` is in the block with header fields
+    (root, block_r, block_hash): O(log n) hashes for the path and one chameleon
+    hash tying the root to the block hash. `proof` is Block.inclusion_proof().
+    """
+    r, path, count = proof
+    tree_root = merkle_root_from_path(merkle_leaf(chameleon_hash, transaction, r), path)
+    if commit_count(count, tree_root) != root:
+        return False
+    return chameleon_hash.hash_exponent(root_exponent(chameleon_hash, root), block_r) == block_hash
 
 class ChameleonHash:
-    def __init__(self, g, h, p, secret_key):
+    def __init__(self, g, h, p, secret_key, q=None, precompute=False, window=6, entropy=None):
         self.g = g  # Generator g
-        self.h = h  # Generator h
+        self.h = h  # Generator h = g^secret_key
         self.p = p  # Large prime number for the cyclic group
+        self.q = q or p - 1  # Prime order of the subgroup generated by g and h
         self.secret_key = secret_key  # Secret key (trapdoor)
+        self.g_table = None  # Fixed-base tables, built by precompute()
+        self.h_table = None
+        self._inverse_secret = None  # secret_key^-1 mod q, computed on first collision
+        self.entropy = entropy  # Source of block randomness with randbelow(n), e.g. a qrng.EntropyPool
+        if precompute:
+            self.precompute(window)
+
+    def precompute(self, window=6):
+        """
+        Build fixed-base exponentiation tables for g and h. Worth it once many
+        hashes are computed with the same parameters, e.g. on chain validation.
+        """
+        exponent_bits = self.q.bit_length()
+        self.g_table = FixedBaseTable(self.g, self.p, exponent_bits, window)
+        self.h_table = FixedBaseTable(self.h, self.p, exponent_bits, window)
     
+    def exponent(self, data):
+        """
+        Map a payload into the exponent space: every payload, integers included,
+        is hashed with SHA-256 over its type-tagged encoding and reduced mod q.
+        """
+        return int.from_bytes(payload_digest(data), "big") % self.q
+
+    def random_exponent(self):
+        """
+        Draw randomness r in [1, q - 1] for a block or leaf, from the entropy source if one is set.
+        """
+        if self.entropy is None:
+            return random.randint(1, self.q - 1)
+        return self.entropy.randbelow(self.q - 1) + 1
+
     def hash(self, data, r):
         """
         Compute the Chameleon Hash using the provided data and randomness r.
-        H(data, r) = g^data * h^r (mod p)
+        H(data, r) = g^m * h^r (mod p) with m = exponent(data)
+        """
+        return self.hash_exponent(self.exponent(data), r)
+
+    def hash_exponent(self, exponent, r):
         """
-        g_pow_data = pow(self.g, data, self.p)
+        Chameleon Hash of a payload already mapped into the exponent space.
+        """
+        if self.g_table is not None:
+            # Exponents can be reduced mod q since g and h have order q
+            return self.g_table.pow_product(exponent % self.q, self.h_table, r % self.q)
+        g_pow_data = pow(self.g, exponent, self.p)
         h_pow_r = pow(self.h, r, self.p)
         return (g_pow_data * h_pow_r) % self.p
 
+    def batch_verify(self, items, security_bits=64):
+        """
+        Check many (exponent, r, hash) triples at once. With random coefficients c_i,
+        prod(hash_i^c_i) must equal g^(sum c_i*m_i) * h^(sum c_i*r_i), which
+        costs one multi-exponentiation with short exponents plus a single hash.
+        This is only sound for hashes inside the prime-order subgroup, so each
+        is checked for membership first; then a bad triple passes with
+        probability about 2^-security_bits. Without a prime-order subgroup
+        (q = p - 1, the legacy default) every triple is hashed on its own.
+        Membership is only cheap for a safe prime; with Schnorr params it is an
+        exponentiation by q per hash and batching is at most about twice as fast
+        as hashing each triple (see params.load_or_generate).
+        """
+        if self.q == self.p - 1:
+            return all(self.hash_exponent(exponent, r) == chameleon_hash for exponent, r, chameleon_hash in items)
+        order = self.q
+        hashes = []
+        coefficients = []
+        exponent_sum = 0
+        r_sum = 0
+        for exponent, r, chameleon_hash in items:
+            if not self.in_group(chameleon_hash):
+                return False
+            coefficient = secrets.randbelow(1 << security_bits) + 1
+            hashes.append(chameleon_hash)
+            coefficients.append(coefficient)
+            exponent_sum += coefficient * exponent
+            r_sum += coefficient * r
+        return multi_pow(hashes, coefficients, self.p) == self.hash_exponent(exponent_sum % order, r_sum % order)
+
+    def in_group(self, value):
+        """
+        Whether value lies in the order-q subgroup generated by g and h. For a
+        safe prime p = 2q + 1 that subgroup is the quadratic residues, told
+        apart with a Jacobi symbol instead of an exponentiation by q.
+        """
+        if not 0 < value < self.p:
+            return False
+        if self.p == 2 * self.q + 1:
+            return jacobi(value, self.p) == 1
+        return pow(value, self.q, self.p) == 1
+
+    def find_invalid(self, items):
+        """
+        Return the position of the first (exponent, r, hash) triple that does not
+        verify, or None if all do. Runs one batch check and only falls back to
+        hashing items one by one when the batch fails.
+        """
+        items = list(items)
+        if self.batch_verify(items):
+            return None
+        for position, (exponent, r, chameleon_hash) in enumerate(items):
+            if self.hash_exponent(exponent, r) != chameleon_hash:
+                return position
+        return None
+
     def find_collision(self, old_data, new_data, old_r):
         """
         Given the old data, new data, and old randomness r, find new randomness r'
         that keeps the hash unchanged using the secret key (trapdoor).
         """
-        delta_data = new_data - old_data
-        inverse_secret = pow(self.secret_key, -1, self.p - 1)  # secret_key^-1 mod (p-1)
-        r_prime = (old_r + (delta_data * inverse_secret) % (self.p - 1)) % (self.p - 1)
+        return self.exponent_collision(self.exponent(old_data), self.exponent(new_data), old_r)
+
+    def exponent_collision(self, old_exponent, new_exponent, old_r):
+        """
+        find_collision for payloads already mapped into the exponent space.
+        """
+        # h = g^x, so g^m * h^r = g^(m + x*r) and r' = r + (m - m') / x (mod q)
+        delta_data = old_exponent - new_exponent
+        r_prime = (old_r + delta_data * self.inverse_secret()) % self.q
         return r_prime
 
+    def find_collisions(self, redactions):
+        """
+        exponent_collision for many (old_exponent, new_exponent, old_r) triples
+        at once, sharing a single trapdoor inverse.
+        """
+        inverse_secret = self.inverse_secret()
+        q = self.q
+        return [(old_r + (old_exponent - new_exponent) * inverse_secret) % q
+                for old_exponent, new_exponent, old_r in redactions]
+
+    def inverse_secret(self):
+        """
+        Return secret_key^-1 mod q, cached after the first call.
+        """
+        if self._inverse_secret is None:
+            self._inverse_secret = pow(self.secret_key, -1, self.q)
+        return self._inverse_secret
+
 class Block:
-    def __init__(self, index, previous_hash, data, chameleon_hash, r=None, timestamp=None):
+    # Without a per-instance __dict__ the shared ChameleonHash reference costs one slot
+    __slots__ = ("index", "previous_hash", "chameleon_hash", "_data", "_digest", "_exponent", "_levels", "r",
+                 "rs", "timestamp", "hash")
+
+    def __init__(self, index, previous_hash, data, chameleon_hash, r=None, timestamp=None, hash=None, rs=None):
         self.index = index
         self.previous_hash = previous_hash
-        self.data = data
         self.chameleon_hash = chameleon_hash
-        self.r = r or random.randint(1, chameleon_hash.p - 1)  # Random value for CHF
+        self.data = data
+        self.r = r or chameleon_hash.random_exponent()  # Random value for CHF
+        # A list of transactions is committed to as a Merkle tree with one chameleon-hashed
+        # leaf per transaction; rs holds the leaf randomness (None for any other payload)
+        if rs is None and hash is None:
+            rs = self.leaf_randomness(data)
+        self.rs = rs
+        if not self.has_valid_body():
+            raise ValueError(f"Block {index} needs one leaf randomness value per transaction.")
         self.timestamp = timestamp or time.time()
-        self.hash = self.compute_chameleon_hash()
+        # A stored or received block keeps its recorded hash so validation can check it
+        self.hash = hash if hash is not None else self.compute_chameleon_hash()
+
+    def serialize(self):
+        """
+        Encode the block for the block store (without the shared ChameleonHash
+        object): a format version byte, then the fields as one wire-encoded list.
+        """
+        out = bytearray([VERSION])
+        encode_value([self.index, self.previous_hash, self.data, self.r, self.timestamp, self.hash, self.rs], out)
+        return bytes(out)
+
+    @classmethod
+    def deserialize(cls, record, chameleon_hash):
+        if not record or record[0] != VERSION:
+            raise ValueError("Unsupported block record version.")
+        try:
+            fields, offset = decode_value(record, 1)
+        except IndexError as e:
+            raise ValueError(f"Corrupt block record: {e}")
+        if offset != len(record) or not isinstance(fields, list) or len(fields) != 7:
+            raise ValueError("Corrupt block record.")
+        index, previous_hash, data, r, timestamp, block_hash, rs = fields
+        return cls(index, previous_hash, data, chameleon_hash, r, timestamp, block_hash, rs)
+
+    def has_valid_body(self):
+        """
+        A Merkle body needs a list payload with exactly one leaf randomness value per transaction.
+        """
+        return self.rs is None or (isinstance(self._data, list) and isinstance(self.rs, list) and
+                                   len(self.rs) == len(self._data))
+
+    def leaf_randomness(self, data):
+        if not isinstance(data, list):
+            return None
+        return [self.chameleon_hash.random_exponent() for _ in data]
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._digest = None  # Payload digest the cached exponent and tree were computed from
+        self._exponent = None  # Payload mapped into the exponent space, computed on first use
+        self._levels = None  # Merkle tree levels, built on first use
+
+    def payload_digest(self):
+        """
+        Digest of the payload, and of the leaf randomness for a Merkle body.
+        """
+        return payload_digest(self._data if self.rs is None else [self._data, self.rs])
+
+    def _refresh(self):
+        """
+        Drop the cached exponent and tree if the payload was changed in place
+        since they were computed, and return the current payload digest.
+        """
+        digest = self.payload_digest()
+        if digest != self._digest:
+            self._digest = digest
+            self._exponent = None
+            self._levels = None
+        return digest
+
+    def body_exponent(self, data, rs):
+        """
+        Map a payload into the exponent space: through its Merkle root when it
+        has leaf randomness, otherwise by hashing it as one value.
+        """
+        if rs is None:
+            return self.chameleon_hash.exponent(data)
+        if len(rs) != len(data):
+            raise ValueError("Merkle body needs one leaf randomness value per transaction.")
+        leaves = [merkle_leaf(self.chameleon_hash, transaction, r) for transaction, r in zip(data, rs)]
+        return root_exponent(self.chameleon_hash, commit_count(len(data), merkle_levels(leaves)[-1][0]))
+
+    def exponent(self):
+        """
+        Return the payload mapped into the exponent space. The payload is
+        digested on every call, but the Merkle tree is only rebuilt when it changed.
+        """
+        digest = self._refresh()
+        if self._exponent is None:
+            if self.rs is None:
+                # Same value as chameleon_hash.exponent(data), from the digest already taken
+                self._exponent = int.from_bytes(digest, "big") % self.chameleon_hash.q
+            else:
+                self._exponent = root_exponent(self.chameleon_hash, self.merkle_root())
+        return self._exponent
+
+    def merkle_levels(self):
+        self._refresh()
+        if self._levels is None:
+            if self.rs is None:
+                raise ValueError(f"Block {self.index} has no Merkle body.")
+            if not self.has_valid_body():
+                raise ValueError(f"Block {self.index} needs one leaf randomness value per transaction.")
+            self._levels = merkle_levels(merkle_leaf(self.chameleon_hash, transaction, r)
+                                         for transaction, r in zip(self._data, self.rs))
+        return self._levels
+
+    def merkle_root(self):
+        """
+        Root the block hash commits to: the tree root bound to the transaction count.
+        """
+        return commit_count(len(self._data), self.merkle_levels()[-1][0])
+
+    def inclusion_proof(self, position):
+        """
+        Return (r, path, transaction count) proving the transaction at `position`, for verify_inclusion.
+        """
+        if not 0 <= position < len(self._data):
+            raise IndexError("Transaction position out of range.")
+        return self.rs[position], merkle_path(self.merkle_levels(), position), len(self._data)
 
     def compute_chameleon_hash(self):
         """
         Compute the Chameleon Hash of the block's data.
         """
-        return self.chameleon_hash.hash(self.data, self.r)
+        return self.chameleon_hash.hash_exponent(self.exponent(), self.r)
 
     def redact_block(self, new_data, secret_key, provided_key):
         """
@@ -53,26 +451,86 @@ class Block:
             raise PermissionError("Invalid secret key. Redaction not allowed.")
         
         # Find new randomness that keeps the hash unchanged
-        new_r = self.chameleon_hash.find_collision(self.data, new_data, self.r)
+        new_rs = self.leaf_randomness(new_data)
+        new_exponent = self.body_exponent(new_data, new_rs)
+        new_r = self.chameleon_hash.exponent_collision(self.exponent(), new_exponent, self.r)
         
         # Update the block's data and randomness, but keep the hash the same
+        self.apply_redaction(new_data, new_exponent, new_r, new_rs)
+        self.hash = self.compute_chameleon_hash()
+
+    def redact_transaction(self, position, new_transaction, secret_key, provided_key):
+        """
+        Redact one transaction of a Merkle body. The collision is taken on its
+        leaf, so the leaf, the tree and the block hash all stay unchanged and
+        only this transaction's leaf is hashed again to check it.
+        """
+        if secret_key != provided_key:
+            raise PermissionError("Invalid secret key. Redaction not allowed.")
+        if self.rs is None:
+            raise ValueError(f"Block {self.index} has no Merkle body.")
+        if not 0 <= position < len(self._data):
+            raise IndexError("Transaction position out of range.")
+
+        self._refresh()  # The cached tree must describe the payload before this redaction
+        old_transaction, old_r = self._data[position], self.rs[position]
+        new_r = self.chameleon_hash.find_collision(old_transaction, new_transaction, old_r)
+        if self.chameleon_hash.hash(new_transaction, new_r) != self.chameleon_hash.hash(old_transaction, old_r):
+            raise ValueError("Redaction does not preserve the transaction's leaf.")
+
+        # Copies, so a list shared with the caller is not changed; cached tree and exponent stay valid
+        self._data = list(self._data)
+        self._data[position] = new_transaction
+        self.rs = list(self.rs)
+        self.rs[position] = new_r
+        self._digest = self.payload_digest()
+
+    def apply_redaction(self, new_data, new_exponent, new_r, new_rs=None):
+        """
+        Replace the payload and randomness with an already computed collision.
+        """
         self.data = new_data
         self.r = new_r
-        self.hash = self.compute_chameleon_hash()
+        self.rs = new_rs
+        self._digest = self.payload_digest()
+        self._exponent = new_exponent
 
 class Blockchain:
-    def __init__(self, chameleon_hash):
-        self.chain = []
+    def __init__(self, chameleon_hash, store_path=None):
         self.chameleon_hash = chameleon_hash
-        self.create_genesis_block()
+        if store_path is None:
+            self.chain = []
+            self.transactions = TransactionIndex()
+        else:
+            # Blocks live in an append-only store on disk and survive restarts
+            store = BlockStore(store_path, Block.serialize,
+                               lambda record: Block.deserialize(record, self.chameleon_hash))
+            store.start_compactor()  # Folds the redaction log back into the segments as it grows
+            self.chain = StoredChain(store)
+            self.transactions = TransactionIndex(os.path.join(store_path, "transactions.idx"))
+        self.checkpoint = ValidationCheckpoint()  # Highest verified height of self.chain
+        if not len(self.chain):
+            self.create_genesis_block()
+        # Blocks stored before a crash, or before the index existed, are indexed now
+        for height in range(self.transactions.height, len(self.chain)):
+            self.transactions.add_block(height, payload_ids(self.chain[height].data))
 
     def create_genesis_block(self):
-        genesis_block = Block(0, "0", 0, self.chameleon_hash, random.randint(1, self.chameleon_hash.p - 1))
+        genesis_block = Block(0, "0", 0, self.chameleon_hash, self.chameleon_hash.random_exponent())
         self.chain.append(genesis_block)
+        self.transactions.add_block(0, payload_ids(genesis_block.data))
 
     def get_last_block(self):
         return self.chain[-1]
 
+    def get_block_by_hash(self, block_hash):
+        """
+        Look a block up by its hash, through the store's hash index when the chain is on disk.
+        """
+        if isinstance(self.chain, StoredChain):
+            return self.chain.store.get_by_hash(block_hash)
+        return next((block for block in self.chain if block.hash == block_hash), None)
+
     def add_block(self, data):
         previous_block = self.get_last_block()
         new_block = Block(index=previous_block.index + 1,
@@ -81,21 +539,88 @@ class Blockchain:
                           chameleon_hash=self.chameleon_hash,
                           timestamp=time.time())
         self.chain.append(new_block)
+        self.transactions.add_block(new_block.index, payload_ids(data))
 
-    def is_chain_valid(self):
+    def find_transaction(self, transaction):
         """
-        Validate the entire chain by checking hashes and previous hash links.
+        Return every (block height, position) holding this transaction, through the transaction index.
         """
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
-            
-            if current_block.hash != current_block.compute_chameleon_hash():
-                return False
-            if current_block.previous_hash != previous_block.hash:
-                return False
+        return self.transactions.get(transaction_id(transaction))
+
+    def find_transactions(self, transactions):
+        return self.transactions.get_many(transaction_id(transaction) for transaction in transactions)
+
+    def is_chain_valid(self, start=None, end=None):
+        """
+        Validate the chain (or the range chain[start:end]) by checking hashes and previous hash links.
+        Without a range, only blocks above the verified-height checkpoint are checked.
+        """
+        if start is not None or end is not None:
+            return self.find_invalid_block(start or 1, end) is None
+
+        start = self.checkpoint.resume_height(self.chain)
+        end = len(self.chain)
+        invalid, tip_hash = self._check_blocks(start, end)
+        if invalid is not None:
+            return False
+        if tip_hash is not None:  # None when no block was above the checkpoint
+            self.checkpoint.advance(end, tip_hash)
         return True
 
+    def find_invalid_block(self, start=1, end=None, batch_size=10000):
+        """
+        Return the height of the first invalid block in chain[start:end], or None.
+        Previous hash links are checked block by block, while the chameleon hashes
+        are checked with one batch verification per `batch_size` blocks, so only
+        one batch of a stored chain is held in memory at a time.
+        """
+        end = len(self.chain) if end is None else min(end, len(self.chain))
+        return self._check_blocks(start, end, batch_size)[0]
+
+    def _check_blocks(self, start, end, batch_size=10000):
+        """
+        Return (first invalid height in chain[start:end] or None, hash of the last block checked).
+        """
+        start = max(start, 1)
+        tip_hash = None
+        for batch_start in range(start, end, batch_size):
+            batch_end = min(batch_start + batch_size, end)
+            blocks = self._load_blocks(batch_start - 1, batch_end)  # Includes the block before the batch for its link
+            # A stored record that no longer decodes, or a body with the wrong leaf count, ends the batch
+            bad_body = next((batch_start + i for i, block in enumerate(blocks[1:])
+                             if not block.has_valid_body()), None)
+            if bad_body is None and len(blocks) < batch_end - batch_start + 1:
+                bad_body = batch_start - 1 + len(blocks)
+            if bad_body is not None:
+                blocks = blocks[:bad_body - batch_start + 1]
+            bad_link = next((batch_start + i for i in range(len(blocks) - 1)
+                             if blocks[i + 1].previous_hash != blocks[i].hash), None)
+
+            items = [(block.exponent(), block.r, block.hash) for block in blocks[1:]]
+            position = self.chameleon_hash.find_invalid(items)
+            bad_hash = None if position is None else batch_start + position
+
+            invalid = [height for height in (bad_link, bad_hash, bad_body) if height is not None]
+            if invalid:
+                return min(invalid), None
+            tip_hash = blocks[-1].hash
+        return None, tip_hash
+
+    def _load_blocks(self, start, end):
+        """
+        Return chain[start:end], cut short at the first stored record that is rejected on decode.
+        """
+        try:
+            return self.chain[start:end]
+        except ValueError:
+            blocks = []
+            for height in range(start, end):
+                try:
+                    blocks.append(self.chain[height])
+                except ValueError:
+                    break
+            return blocks
+
     def redact_block(self, block_index, new_data, provided_key):
         """
         Redact a block's data if the user has the correct secret key and propagate
@@ -105,42 +630,125 @@ class Blockchain:
             raise IndexError("Block index out of range.")
 
         block_to_redact = self.chain[block_index]
+        old_ids = payload_ids(block_to_redact.data)
         block_to_redact.redact_block(new_data, self.chameleon_hash.secret_key, provided_key)
-        
+        # A stored chain hands out decoded copies; writing back appends only this block's record
+        self.chain[block_index] = block_to_redact
+        self.transactions.update(block_index, old_ids, payload_ids(new_data))
+        self.checkpoint.invalidate(block_index, block_to_redact.previous_hash)
+
+    def redact_transaction(self, block_index, position, new_transaction, provided_key):
+        """
+        Redact a single transaction of a block, keeping the block's Merkle root and hash.
+        """
+        if block_index >= len(self.chain):
+            raise IndexError("Block index out of range.")
+
+        block = self.chain[block_index]
+        old_transaction = block.data[position] if isinstance(block.data, list) else None
+        block.redact_transaction(position, new_transaction, self.chameleon_hash.secret_key, provided_key)
+        self.chain[block_index] = block
+        self.transactions.update(block_index, [(position, transaction_id(old_transaction))],
+                                 [(position, transaction_id(new_transaction))])
+        self.checkpoint.invalidate(block_index, block.previous_hash)
+
+    def redact_by_content(self, transaction, new_transaction, provided_key):
+        """
+        Redact every occurrence of a transaction, found through the transaction
+        index: single transactions of a list payload, or whole other payloads.
+        Returns the (block height, position) locations that were redacted.
+        """
+        if self.chameleon_hash.secret_key != provided_key:
+            raise PermissionError("Invalid secret key. Redaction not allowed.")
+        locations = self.find_transaction(transaction)
+        for block_index, position in locations:
+            if position is None:
+                self.redact_block(block_index, new_transaction, provided_key)
+            else:
+                self.redact_transaction(block_index, position, new_transaction, provided_key)
+        return locations
+
+    def redact_many(self, redactions, provided_key):
+        """
+        Redact many blocks at once from a list of (block_index, new_data) pairs.
+        All collisions are computed with one cached trapdoor inverse and checked
+        with a single batch verification over the touched blocks before any
+        block is changed, so either every redaction is applied or none is.
+        """
+        if self.chameleon_hash.secret_key != provided_key:
+            raise PermissionError("Invalid secret key. Redaction not allowed.")
+
+        # Later entries for the same block win; the collision is taken from the current data
+        latest = {}
+        for block_index, new_data in redactions:
+            if not 0 <= block_index < len(self.chain):
+                raise IndexError("Block index out of range.")
+            latest[block_index] = new_data
+
+        blocks = [self.chain[block_index] for block_index in latest]
+        old_ids = [payload_ids(block.data) for block in blocks]
+        new_rs_list = [block.leaf_randomness(new_data) for block, new_data in zip(blocks, latest.values())]
+        new_exponents = [block.body_exponent(new_data, new_rs)
+                         for block, new_data, new_rs in zip(blocks, latest.values(), new_rs_list)]
+        new_rs = self.chameleon_hash.find_collisions(
+            [(block.exponent(), new_exponent, block.r) for block, new_exponent in zip(blocks, new_exponents)])
+
+        items = [(new_exponent, new_r, block.hash) for block, new_exponent, new_r in zip(blocks, new_exponents, new_rs)]
+        if not self.chameleon_hash.batch_verify(items):
+            raise ValueError("Redaction batch does not preserve block hashes.")
+
+        for block, new_data, new_exponent, new_r, new_leaf_rs in zip(blocks, latest.values(), new_exponents,
+                                                                    new_rs, new_rs_list):
+            block.apply_redaction(new_data, new_exponent, new_r, new_leaf_rs)
+        if isinstance(self.chain, StoredChain):
+            # All redacted records are persisted as one atomic frame in the store's redaction log
+            self.chain.store.rewrite_many((block.index, block) for block in blocks)
+        for block, old in zip(blocks, old_ids):
+            self.transactions.update(block.index, old, payload_ids(block.data))
+        if blocks:
+            first = min(blocks, key=lambda block: block.index)
+            self.checkpoint.invalidate(first.index, first.previous_hash)
+
 
+if __name__ == "__main__":
+    # Load the 2048-bit group parameters and admin trapdoor, generating them on first run
+    params = load_or_generate()
+    secret_key = params["secret_key"]  # Admin secret key
 
-# Define group parameters for the Chameleon Hash
-g = 2
-h = 5
-p = 101  # A small prime for simplicity
-secret_key = 45  # Admin secret key
+    # Initialize the Chameleon Hash function
+    chf = ChameleonHash(**params)
 
-# Initialize the Chameleon Hash function
-chf = ChameleonHash(g, h, p, secret_key)
+    # Create a new blockchain using Chameleon Hash
+    blockchain = Blockchain(chf)
 
-# Create a new blockchain using Chameleon Hash
-blockchain = Blockchain(chf)
+    # Add a few blocks
+    blockchain.add_block(10)
+    blockchain.add_block(20)
+    blockchain.add_block(30)
+    blockchain.add_block(["Alice pays Bob 5", "Bob pays Carol 2", "Carol pays Dave 1"])
 
-# Add a few blocks
-blockchain.add_block(10)
-blockchain.add_block(20)
-blockchain.add_block(30)
+    # Print original blockchain
+    print("Original Blockchain:")
+    for block in blockchain.chain:
+        print(f"Block {block.index} [Hash: {str(block.hash)[:16]}...] | Data: {block.data}")
 
-# Print original blockchain
-print("Original Blockchain:")
-for block in blockchain.chain:
-    print(f"Block {block.index} [Hash: {block.hash}] | Data: {block.data}")
+    # Redact block 1 with new data, while keeping the hash unchanged
+    try:
+        blockchain.redact_block(1, 999, provided_key=secret_key)
+    except PermissionError as e:
+        print(e)
 
-# Redact block 1 with new data, while keeping the hash unchanged
-try:
-    blockchain.redact_block(1, 999, provided_key=secret_key)
-except PermissionError as e:
-    print(e)
+    # Scrub a transaction found through the transaction index; block 4's root and hash stay the same
+    print("\n'Bob pays Carol 2' is at (height, position):", blockchain.find_transaction("Bob pays Carol 2"))
+    blockchain.redact_by_content("Bob pays Carol 2", "[redacted]", provided_key=secret_key)
+    block = blockchain.chain[4]
+    print("Inclusion proof for the redacted transaction verifies?",
+          verify_inclusion(chf, "[redacted]", block.inclusion_proof(1), block.merkle_root(), block.r, block.hash))
 
-# Print updated blockchain after redaction
-print("\nBlockchain After Redaction (Hash unchanged):")
-for block in blockchain.chain:
-    print(f"Block {block.index} [Hash: {block.hash}] | Data: {block.data}")
+    # Print updated blockchain after redaction
+    print("\nBlockchain After Redaction (Hash unchanged):")
+    for block in blockchain.chain:
+        print(f"Block {block.index} [Hash: {str(block.hash)[:16]}...] | Data: {block.data}")
 
-# Validate the blockchain after redaction
-print("\nIs blockchain valid?", blockchain.is_chain_valid())
+    # Validate the blockchain after redaction
+    print("\nIs blockchain valid?", blockchain.is_chain_valid())
@@ -0,0 +1,132 @@
+class FixedBaseTable:
+    def __init__(self, base, modulus, exponent_bits, window=6):
+        """
+        Precomputes base^(d * 2^(window*i)) mod modulus for every window position i
+        and digit d, so base^e needs one table lookup and multiplication per window
+        instead of a full square-and-multiply.
+        """
+        self.modulus = modulus
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.rows = []
+
+        step = base % modulus  # base^(2^(window*i)) for the current row
+        for _ in range(-(-exponent_bits // window)):
+            row = [1] * (1 << window)
+            for digit in range(1, 1 << window):
+                row[digit] = row[digit - 1] * step % modulus
+            self.rows.append(row)
+            step = row[-1] * step % modulus
+        self.max_exponent = 1 << (len(self.rows) * window)
+
+    def pow(self, exponent):
+        """
+        Returns base^exponent mod modulus for 0 <= exponent < max_exponent.
+        """
+        if not 0 <= exponent < self.max_exponent:
+            raise ValueError("Exponent outside the precomputed range.")
+        result = 1
+        for row in self.rows:
+            digit = exponent & self.mask
+            if digit:
+                result = result * row[digit] % self.modulus
+            exponent >>= self.window
+        return result
+
+    def pow_product(self, exponent, other, other_exponent):
+        """
+        Returns base^exponent * other_base^other_exponent mod modulus using a single
+        accumulator over both tables (Shamir's trick for fixed bases), so the
+        product needs no separate final multiplication or second result.
+        """
+        if not (0 <= exponent < self.max_exponent and 0 <= other_exponent < other.max_exponent):
+            raise ValueError("Exponent outside the precomputed range.")
+        if other.window != self.window or other.modulus != self.modulus:
+            raise ValueError("Tables must share modulus and window size.")
+        modulus, window, mask = self.modulus, self.window, self.mask
+        result = 1
+        for row, other_row in zip(self.rows, other.rows):
+            digit = exponent & mask
+            other_digit = other_exponent & mask
+            if digit:
+                result = result * row[digit] % modulus
+            if other_digit:
+                result = result * other_row[other_digit] % modulus
+            exponent >>= window
+            other_exponent >>= window
+        return result
+
+
+def multi_pow(bases, exponents, modulus, window=None):
+    """
+    Returns prod(base_i^exponent_i) mod modulus as one multi-exponentiation
+    (bucket / Pippenger method): every window of exponent bits costs one
+    multiplication per base plus a fixed 2^(window+1) bucket combination, and
+    the squarings are shared by all bases.
+    """
+    bases = list(bases)
+    exponents = list(exponents)
+    if not bases:
+        return 1 % modulus
+    if window is None:
+        window = max(1, min(16, len(bases).bit_length() - 2))
+    mask = (1 << window) - 1
+    max_bits = max(exponent.bit_length() for exponent in exponents)
+
+    result = 1
+    for shift in reversed(range(0, max_bits, window)):
+        for _ in range(window):
+            result = result * result % modulus
+
+        buckets = [1] * (1 << window)
+        for base, exponent in zip(bases, exponents):
+            digit = (exponent >> shift) & mask
+            if digit:
+                buckets[digit] = buckets[digit] * base % modulus
+
+        # prod(bucket_d^d) via running products from the top bucket down
+        running = 1
+        window_total = 1
+        for digit in range(mask, 0, -1):
+            if buckets[digit] != 1:
+                running = running * buckets[digit] % modulus
+            window_total = window_total * running % modulus
+        result = result * window_total % modulus
+    return result
+
+
+def benchmark(sizes=(2048, 3072), window=6, rounds=20):
+    """
+    Compares g^m * h^r mod p computed with two built-in pow() calls against the
+    precomputed tables, at realistic modulus sizes. Exponentiation cost does not
+    depend on primality, so a random odd modulus of the right size is used.
+    """
+    import random
+    import time
+
+    for bits in sizes:
+        p = random.getrandbits(bits) | (1 << (bits - 1)) | 1
+        g, h = 2, 5
+        exponents = [(random.getrandbits(bits) % (p - 1), random.getrandbits(bits) % (p - 1))
+                     for _ in range(rounds)]
+
+        start = time.perf_counter()
+        g_table = FixedBaseTable(g, p, (p - 1).bit_length(), window)
+        h_table = FixedBaseTable(h, p, (p - 1).bit_length(), window)
+        setup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [pow(g, m, p) * pow(h, r, p) % p for m, r in exponents]
+        plain = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        actual = [g_table.pow_product(m, h_table, r) for m, r in exponents]
+        tabled = (time.perf_counter() - start) / rounds
+
+        assert actual == expected
+        print(f"{bits}-bit: pow() {plain * 1e3:.2f} ms | tables {tabled * 1e3:.2f} ms | "
+              f"x{plain / tabled:.1f} (one-off setup {setup:.2f} s)")
+
+
+if __name__ == "__main__":
+    benchmark()
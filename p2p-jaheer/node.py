@@ -1,7 +1,10 @@
-import socket
-import threading
-import json
+from peer import ConnectionPool
+from server import AsyncServer
 from blockchain import Blockchain
+from gossip import Gossip
+from sync import InitialSync, serve_sync_request
+from wire import (MSG_BLOCK, MSG_GETBLOCKS, MSG_GETDATA, MSG_GETHEADERS, MSG_HELLO, MSG_INV,
+                  MSG_TRANSACTION, decode_message, encode_message, transaction_hash)
 
 class Node:
     def __init__(self, host, port, blockchain):
@@ -9,61 +12,62 @@ class Node:
         self.port = port
         self.blockchain = blockchain
         self.peers = []  # Connected peers
+        # One persistent framed connection per peer, opened with our listening address
+        self.pool = ConnectionPool(hello=encode_message(MSG_HELLO, [host, port]))
+        self.gossip = Gossip(self.pool)  # Items are announced by hash and sent once per peer
+        self.server = None
 
     def start(self):
-        server_thread = threading.Thread(target=self.start_server)
-        server_thread.start()
-
-    def start_server(self):
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind((self.host, self.port))
-        server_socket.listen(5)
+        # All peer connections are served from one asyncio event loop in a background thread
+        self.server = AsyncServer(self.host, self.port, self.handle_message)
+        self.server.start()
+        self.server.call_every(1.0, self.gossip.retry_expired)  # Re-request items a peer never sent
         print(f"Node started on {self.host}:{self.port} and listening for peers...")
-        
-        while True:
-            conn, addr = server_socket.accept()
-            threading.Thread(target=self.handle_peer, args=(conn, addr)).start()
-
-    def handle_peer(self, conn, addr):
-        print(f"Connected by {addr}")
-        data = conn.recv(1024).decode()
-        if data:
-            self.handle_message(data, conn)
 
     def handle_message(self, message, conn):
         try:
-            message = json.loads(message)
-            if message['type'] == 'block':
-                self.receive_block(message['block'])
-            elif message['type'] == 'transaction':
-                self.receive_transaction(message['transaction'])
+            kind, value = decode_message(message)
+            peer = conn.peer
+            if kind == MSG_HELLO:
+                conn.peer = (value[0], value[1])
+                if conn.peer not in self.peers:
+                    self.peers.append(conn.peer)
+            elif kind == MSG_INV and peer is not None:
+                self.gossip.on_inv(peer, value)
+            elif kind == MSG_GETDATA and peer is not None:
+                self.gossip.on_getdata(peer, value)
+            elif kind in (MSG_GETHEADERS, MSG_GETBLOCKS):
+                serve_sync_request(self.blockchain, kind, value, conn)
+            elif kind == MSG_BLOCK:
+                if self.gossip.receive(peer, (MSG_BLOCK, bytes.fromhex(value.hash))):
+                    self.receive_block(value)
+            elif kind == MSG_TRANSACTION:
+                if self.gossip.receive(peer, (MSG_TRANSACTION, transaction_hash(value))):
+                    self.receive_transaction(value)
         except Exception as e:
             print(f"Error processing message: {e}")
-        conn.close()
 
     def connect_to_peer(self, peer_host, peer_port):
         try:
-            peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            peer_socket.connect((peer_host, peer_port))
+            self.pool.get((peer_host, peer_port)).open()
             self.peers.append((peer_host, peer_port))
             print(f"Connected to peer {peer_host}:{peer_port}")
         except Exception as e:
             print(f"Failed to connect to peer {peer_host}:{peer_port}: {e}")
 
+    def sync(self):
+        """
+        Initial block download: fetch whatever our peers have above our tip.
+        """
+        appended, rate = InitialSync(self.blockchain, self.peers).run()
+        print(f"Synced {appended} blocks from peers ({rate:.0f} blocks/s)")
+
     def send_to_peers(self, message):
-        for peer in self.peers:
-            try:
-                peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                peer_socket.connect(peer)
-                peer_socket.sendall(message.encode())
-                peer_socket.close()
-            except Exception as e:
-                print(f"Error sending message to peer {peer}: {e}")
+        self.pool.relay(message, self.peers)
 
-    def receive_block(self, block_data):
-        print(f"Received new block from peer: {block_data}")
-        block = Block(**block_data)  # Deserialize block data
-        proof = block_data['hash']
+    def receive_block(self, block):
+        print(f"Received new block from peer: {block.to_dict()}")
+        proof = block.hash
         if self.blockchain.add_block(block, proof):
             print("Block added to the blockchain")
             self.broadcast_block(block)
@@ -72,12 +76,13 @@ class Node:
 
     def receive_transaction(self, transaction):
         print(f"Received new transaction: {transaction}")
+        self.blockchain.unconfirmed_transactions.add(transaction)
         self.broadcast_transaction(transaction)
 
     def broadcast_block(self, block):
-        message = json.dumps({"type": "block", "block": block.__dict__})
-        self.send_to_peers(message)
+        self.gossip.announce((MSG_BLOCK, bytes.fromhex(block.hash)), encode_message(MSG_BLOCK, block),
+                             self.peers)
 
     def broadcast_transaction(self, transaction):
-        message = json.dumps({"type": "transaction", "transaction": transaction})
-        self.send_to_peers(message)
+        self.gossip.announce((MSG_TRANSACTION, transaction_hash(transaction)),
+                             encode_message(MSG_TRANSACTION, transaction), self.peers)
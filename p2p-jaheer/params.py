@@ -0,0 +1,219 @@
+import json
+import os
+import secrets
+
+SMALL_PRIMES = [n for n in range(3, 2000, 2) if all(n % d for d in range(3, int(n ** 0.5) + 1, 2))]
+
+# Safe primes p = 2q + 1 from the RFC 3526 MODP groups. They are fixed and
+# well studied, so no generation is needed for the safe-prime variant.
+MODP_PRIMES = {
+    2048: int(
+        "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+        "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+        "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+        "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+        "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+        "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+        "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+        "3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF", 16),
+    3072: int(
+        "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+        "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+        "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+        "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+        "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+        "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+        "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+        "3995497CEA956AE515D2261898FA051015728E5A8AAAC42DAD33170D04507A33"
+        "A85521ABDF1CBA64ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7"
+        "ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6BF12FFA06D98A0864"
+        "D87602733EC86A64521F2B18177B200CBBE117577A615D6C770988C0BAD946E2"
+        "08E24FA074E5AB3143DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF", 16),
+}
+
+DEFAULT_CACHE = "chf_params_{bits}.json"
+SAFE_PRIME_CACHE = "chf_params_{bits}_safe.json"
+
+
+def is_probable_prime(n, rounds=40):
+    """
+    Miller-Rabin primality test after trial division by small primes.
+    """
+    if n < 2:
+        return False
+    if n in (2, 3):
+        return True
+    if n % 2 == 0:
+        return False
+    for small_prime in SMALL_PRIMES:
+        if n % small_prime == 0:
+            return n == small_prime
+
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for _ in range(rounds):
+        a = secrets.randbelow(n - 3) + 2
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def generate_prime(bits):
+    """
+    Returns a random prime with exactly `bits` bits.
+    """
+    while True:
+        candidate = secrets.randbits(bits) | (1 << (bits - 1)) | 1
+        if is_probable_prime(candidate):
+            return candidate
+
+
+def generate_group(bits=2048, q_bits=256):
+    """
+    Returns (p, q) where p is a `bits`-bit prime and q a `q_bits`-bit prime
+    dividing p - 1 (a Schnorr group, as used by DSA). Exponents then live mod q,
+    which keeps hashing and collision finding cheap at large p.
+    """
+    q = generate_prime(q_bits)
+    while True:
+        k = secrets.randbits(bits - q_bits) | (1 << (bits - q_bits - 1))
+        k -= k % 2  # k even so that p = kq + 1 is odd
+        p = k * q + 1
+        if p.bit_length() != bits:
+            continue
+        # Cheap sieve before the expensive Miller-Rabin rounds
+        if any(p % small_prime == 0 for small_prime in SMALL_PRIMES):
+            continue
+        if is_probable_prime(p):
+            return p, q
+
+
+def find_generator(p, q):
+    """
+    Returns a generator of the order-q subgroup of Z_p*.
+    """
+    cofactor = (p - 1) // q
+    while True:
+        g = pow(secrets.randbelow(p - 3) + 2, cofactor, p)
+        if g != 1:
+            return g
+
+
+def with_trapdoor(p, q, g):
+    """
+    Picks a fresh secret key x and sets h = g^x, so that collisions can be
+    computed with x while h still generates the same prime-order group.
+    """
+    secret_key = secrets.randbelow(q - 1) + 1
+    return {"p": p, "q": q, "g": g, "h": pow(g, secret_key, p), "secret_key": secret_key}
+
+
+def generate_params(bits=2048, q_bits=256):
+    """
+    Generates Schnorr-group Chameleon Hash parameters with a fresh trapdoor.
+    """
+    p, q = generate_group(bits, q_bits)
+    return with_trapdoor(p, q, find_generator(p, q))
+
+
+def safe_prime_params(bits=2048):
+    """
+    Chameleon Hash parameters over an RFC 3526 safe prime p = 2q + 1. g = 4 is a
+    quadratic residue other than 1, so it generates the subgroup of prime order q.
+    """
+    if bits not in MODP_PRIMES:
+        raise ValueError(f"No cached safe-prime group of {bits} bits.")
+    p = MODP_PRIMES[bits]
+    return with_trapdoor(p, (p - 1) // 2, 4)
+
+
+def validate_params(params):
+    """
+    Checks that g and h lie in a subgroup of prime order q and that the trapdoor matches h.
+    """
+    p, q, g, h = params["p"], params["q"], params["g"], params["h"]
+    if (p - 1) % q != 0 or g in (0, 1) or pow(g, q, p) != 1:
+        raise ValueError("g does not generate a subgroup of order q.")
+    if pow(g, params["secret_key"], p) != h:
+        raise ValueError("h does not match the secret key.")
+
+
+def save_params(params, path):
+    """
+    Writes parameters as JSON, readable only by the owner since they include the trapdoor.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({key: hex(value) for key, value in params.items()}, f, indent=2)
+
+
+def load_params(path):
+    with open(path) as f:
+        params = {key: int(value, 16) for key, value in json.load(f).items()}
+    validate_params(params)
+    return params
+
+
+def load_or_generate(path=None, bits=2048, q_bits=256, safe_prime=False):
+    """
+    Loads cached parameters, generating and caching them on first use so node
+    startup does not pay for prime generation again. The default Schnorr group
+    keeps single hashes cheap, but batch verification gains little over hashing
+    every block: its per-hash membership check is a full exponentiation by q,
+    most of the batch time. With safe_prime the RFC 3526 group is used instead,
+    where membership is a Jacobi symbol and batches of a few hundred blocks
+    verify an order of magnitude faster than serially, at several times the
+    cost of each single hash (r is then about as long as p).
+    """
+    path = path or (SAFE_PRIME_CACHE if safe_prime else DEFAULT_CACHE).format(bits=bits)
+    if os.path.exists(path):
+        return load_params(path)
+    params = safe_prime_params(bits) if safe_prime else generate_params(bits, q_bits)
+    save_params(params, path)
+    return params
+
+
+def benchmark(sizes=(2048, 3072), rounds=10):
+    """
+    Reports generation, hash and collision cost per parameter size for the
+    Schnorr-group parameters and the RFC 3526 safe-prime groups.
+    """
+    import time
+    from chf import ChameleonHash
+
+    for bits in sizes:
+        start = time.perf_counter()
+        schnorr = generate_params(bits)
+        generation = time.perf_counter() - start
+
+        for name, params in (("schnorr", schnorr), ("safe-prime", safe_prime_params(bits))):
+            chf = ChameleonHash(**params)
+            samples = [(secrets.randbelow(params["q"]), secrets.randbelow(params["q"])) for _ in range(rounds)]
+
+            start = time.perf_counter()
+            for data, r in samples:
+                chf.hash(data, r)
+            hash_cost = (time.perf_counter() - start) / rounds
+
+            start = time.perf_counter()
+            for data, r in samples:
+                chf.find_collision(data, data + 1, r)
+            collision_cost = (time.perf_counter() - start) / rounds
+
+            print(f"{bits}-bit {name:>10} (q {params['q'].bit_length()} bits): "
+                  f"hash {hash_cost * 1e3:.2f} ms | collision {collision_cost * 1e3:.3f} ms")
+        print(f"{bits}-bit schnorr group generation: {generation:.1f} s")
+
+
+if __name__ == "__main__":
+    benchmark()
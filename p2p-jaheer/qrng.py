@@ -0,0 +1,183 @@
+import secrets
+import threading
+import time
+
+
+def aer_backend():
+    """
+    Local Aer simulator, the backend the QRNG notebook uses.
+    """
+    from qiskit_aer import AerSimulator
+
+    return AerSimulator()
+
+
+def random_circuit(qubits):
+    """
+    Hadamard on every qubit, then measure them all: each shot yields `qubits` uniform bits.
+    """
+    from qiskit import QuantumCircuit
+
+    circuit = QuantumCircuit(qubits, qubits)
+    circuit.h(range(qubits))
+    circuit.measure(range(qubits), range(qubits))
+    return circuit
+
+
+class QuantumRandom:
+    def __init__(self, backend=None, qubits=16, shots=8192):
+        """
+        Generates random bits in bulk: one job runs a `qubits`-qubit circuit for
+        `shots` shots and returns qubits * shots bits, where the notebook's
+        qrng() ran one single-shot, single-qubit job per bit. The circuit is
+        transpiled once and reused for every job.
+        """
+        from qiskit import transpile
+
+        self.backend = backend or aer_backend()
+        self.qubits = qubits
+        self.shots = shots
+        self.circuit = transpile(random_circuit(qubits), self.backend)
+
+    def job_bytes(self):
+        """
+        Run one job and return its qubits * shots bits packed into bytes.
+        """
+        result = self.backend.run(self.circuit, shots=self.shots, memory=True).result()
+        bits = "".join(result.get_memory(self.circuit))
+        bits = bits[:len(bits) - len(bits) % 8]
+        return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+    def bits(self, count):
+        """
+        Return `count` random bits as a binary string, like the notebook's qrng(bits).
+        """
+        data = bytearray()
+        while len(data) * 8 < count:
+            data += self.job_bytes()
+        return bin(int.from_bytes(data, "big"))[2:].zfill(len(data) * 8)[:count]
+
+
+class EntropyPool:
+    def __init__(self, source=None, capacity=1 << 16, low_water=1 << 14):
+        """
+        Buffer of quantum random bytes refilled by a background thread whenever
+        it drops below `low_water`, up to `capacity` bytes. Reads never wait for
+        a job: if the buffer cannot cover a read, the missing bytes come from
+        the OS generator (secrets) and are counted in `fallback_bytes`.
+        """
+        self.source = source or QuantumRandom()
+        self.capacity = capacity
+        self.low_water = low_water
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.quantum_bytes = 0
+        self.fallback_bytes = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def fill(self):
+        while True:
+            with self.condition:
+                while not self.stopped and len(self.buffer) >= self.low_water:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+            data = self.source.job_bytes()  # Outside the lock, so reads go on during a job
+            with self.condition:
+                self.buffer += data[:max(self.capacity - len(self.buffer), 0)]
+                self.condition.notify_all()
+
+    def wait_filled(self, size=None, timeout=None):
+        """
+        Block until the buffer holds `size` bytes (default low_water), e.g. before creating many blocks.
+        """
+        size = self.low_water if size is None else size
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.buffer) >= size or self.stopped, timeout)
+
+    def read(self, size):
+        with self.condition:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            if len(self.buffer) < self.low_water:
+                self.condition.notify_all()
+        self.quantum_bytes += len(data)
+        if len(data) < size:
+            self.fallback_bytes += size - len(data)
+            data += secrets.token_bytes(size - len(data))
+        return data
+
+    def randbelow(self, n):
+        """
+        Uniform integer in [0, n), by rejection sampling on pool bytes.
+        """
+        bits = max(n - 1, 1).bit_length()
+        while True:
+            value = int.from_bytes(self.read((bits + 7) // 8), "big") >> (-bits % 8)
+            if value < n:
+                return value
+
+
+def notebook_qrng(backend, bits):
+    """
+    The notebook's loop: one single-shot, single-qubit job per bit.
+    """
+    from qiskit import QuantumCircuit
+
+    qc = QuantumCircuit(1, 1)
+    random_bits = ""
+    for _ in range(bits):
+        qc.h(0)
+        qc.measure(0, 0)
+        result = backend.run(qc, shots=1).result()
+        random_bits += list(result.get_counts(qc).keys())[0]
+        qc.reset(0)
+    return random_bits
+
+
+def benchmark(loop_bits=256, batch_bits=1 << 20):
+    """
+    Reports bits/sec on the local Aer simulator of the notebook's loop
+    (`loop_bits` bits) against batched jobs (`batch_bits` bits), and the time
+    to draw chameleon-hash randomness for 1000 blocks from a filled pool.
+    """
+    backend = aer_backend()
+
+    start = time.perf_counter()
+    notebook_qrng(backend, loop_bits)
+    loop_rate = loop_bits / (time.perf_counter() - start)
+
+    source = QuantumRandom(backend)
+    start = time.perf_counter()
+    bits = source.bits(batch_bits)
+    batch_rate = batch_bits / (time.perf_counter() - start)
+    ones = bits.count("1") / len(bits)
+
+    pool = EntropyPool(source).start()
+    pool.wait_filled()
+    order = (1 << 256) - 189  # A 256-bit group order, as in ChameleonHash.q
+    start = time.perf_counter()
+    for _ in range(1000):
+        pool.randbelow(order - 1)
+    draw_time = time.perf_counter() - start
+    pool.stop()
+
+    print(f"notebook loop {loop_rate:,.0f} bits/s | batched {source.qubits} qubits x {source.shots} shots "
+          f"{batch_rate:,.0f} bits/s ({batch_rate / loop_rate:,.0f}x, {ones:.3f} ones) | "
+          f"1000 block r values from the pool in {draw_time * 1e3:.1f} ms, "
+          f"{pool.fallback_bytes} fallback bytes")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,10 +1,17 @@
 import sys
 from blockchain import Blockchain
+from miner import ParallelMiner
 from node import Node
+from retarget import Retargeter
+from validator import ParallelValidator
 
 def start_node(host, port, peer_host=None, peer_port=None):
     # Create a new blockchain instance
-    blockchain = Blockchain(difficulty=2)  # Adjust difficulty as needed
+    # Starting difficulty; retuned every 10 blocks towards one block every 10 seconds
+    # The chain is kept in chaindata-<port>/ so it survives a restart
+    blockchain = Blockchain(difficulty=2, miner=ParallelMiner(),
+                            retargeter=Retargeter(block_time=10.0, interval=10),
+                            store_path=f"chaindata-{port}", validator=ParallelValidator())
 
     # Create a P2P node
     node = Node(host, port, blockchain)
@@ -15,6 +22,7 @@ def start_node(host, port, peer_host=None, peer_port=None):
     # If peer information is provided, connect to the peer
     if peer_host and peer_port:
         node.connect_to_peer(peer_host, peer_port)
+        node.sync()  # Catch up on the peer's chain before mining on top of it
     else:
         print("This node is running standalone, connect peers manually if needed.")
 
@@ -31,14 +39,14 @@ def start_node(host, port, peer_host=None, peer_port=None):
         if choice == "1":
             # Mine a new block with a simple transaction
             transaction_data = input("Enter transaction data: ")
-            blockchain.unconfirmed_transactions.append(transaction_data)
+            blockchain.unconfirmed_transactions.add(transaction_data)
             last_block = blockchain.get_last_block()
 
             new_block = blockchain.create_new_block(last_block)
             proof = blockchain.proof_of_work(new_block)
 
             if blockchain.add_block(new_block, proof):
-                print(f"Block mined and added: {new_block.__dict__}")
+                print(f"Block mined and added: {new_block.to_dict()}")
                 node.broadcast_block(new_block)
             else:
                 print("Failed to mine block")
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from peer import FRAME_HEADER, MAX_FRAME
+
+
+async def read_frame(reader):
+    """
+    Reads one length-prefixed frame, or returns None when the peer closed the stream.
+    """
+    try:
+        length, = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        if length > MAX_FRAME:
+            raise ValueError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit.")
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class StreamConnection:
+    def __init__(self, server, writer):
+        """
+        An accepted peer connection, handed to the message handler so it can reply.
+        """
+        self.server = server
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.peer = None  # Listening address the peer announced in its hello, for replies
+
+    async def write(self, payload):
+        self.writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+        await self.writer.drain()  # Waits while the peer is not reading fast enough
+
+    def send(self, payload):
+        """
+        Queues one framed message to the peer; safe to call from any thread.
+        """
+        return asyncio.run_coroutine_threadsafe(self.write(payload), self.server.loop)
+
+
+class AsyncServer:
+    def __init__(self, host, port, handler, max_connections=10000, executor_workers=None):
+        """
+        Serves framed peer connections from one asyncio event loop running in a
+        background thread, instead of one thread per connection.
+
+        handler(payload, connection) runs on the loop thread, so messages are
+        handled one at a time, and a peer sending faster than that is slowed
+        down by TCP flow control since its stream is not read meanwhile.
+        Blocking work such as mining belongs in run_in_executor().
+        """
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.max_connections = max_connections
+        self.executor = ThreadPoolExecutor(executor_workers)
+        self.connections = set()
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+
+    def start(self, daemon=False):
+        threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=daemon).start()
+        self.ready.wait()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.set_default_executor(self.executor)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]  # Resolves port 0
+        self.ready.set()
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    async def handle_connection(self, reader, writer):
+        if len(self.connections) >= self.max_connections:
+            writer.close()
+            return
+        connection = StreamConnection(self, writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    break
+                self.handler(payload, connection)
+        except (OSError, ValueError) as e:
+            print(f"Connection with {connection.address} dropped: {e}")
+        except asyncio.CancelledError:
+            pass  # Server stopped; the connection is closed below
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    def call_every(self, interval, function):
+        """
+        Runs function() on the loop thread every `interval` seconds while the server runs.
+        """
+        def tick():
+            try:
+                function()
+            except Exception as e:
+                print(f"Error in periodic task: {e}")
+            self.loop.call_later(interval, tick)
+
+        self.loop.call_soon_threadsafe(self.loop.call_later, interval, tick)
+
+    def run_in_executor(self, function, *args):
+        """
+        Runs blocking work off the event loop, returning a concurrent.futures.Future.
+        """
+        return self.executor.submit(function, *args)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.executor.shutdown(wait=False)
+
+
+def benchmark(connections=2000, messages=10, size=200):
+    """
+    Opens `connections` concurrent client connections to an AsyncServer, sends
+    `messages` frames on each and reports how many were held at once, the
+    message rate and the number of threads the server process needed.
+    """
+    received = [0]
+    done = threading.Event()
+    total = connections * messages
+
+    def handler(payload, connection):
+        received[0] += 1
+        if received[0] == total:
+            done.set()
+
+    server = AsyncServer("127.0.0.1", 0, handler)
+    server.start(daemon=True)
+    frame = FRAME_HEADER.pack(size) + b"x" * size
+
+    async def clients():
+        streams = [await asyncio.open_connection("127.0.0.1", server.port) for _ in range(connections)]
+        await asyncio.sleep(0.2)
+        held = len(server.connections)
+        start = time.perf_counter()
+        for _ in range(messages):
+            for _, writer in streams:
+                writer.write(frame)
+        for _, writer in streams:
+            await writer.drain()
+        await asyncio.get_running_loop().run_in_executor(None, done.wait)
+        elapsed = time.perf_counter() - start
+        for _, writer in streams:
+            writer.close()
+        return held, elapsed
+
+    held, elapsed = asyncio.run(clients())
+    server.stop()
+    print(f"{held} concurrent connections | {total / elapsed:,.0f} msg/s | "
+          f"{threading.active_count()} threads in process")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,458 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+# One fixed-width index entry per height: segment number, offset, record length
+# and the SHA-256 of the block hash (used for the hash -> height index).
+INDEX_ENTRY = struct.Struct(">IQI32s")
+RECORD_HEADER = struct.Struct(">I")
+
+# Redaction log: frames of (payload length, crc32) followed by a payload of
+# (count) and then count x (height, record length, record). A frame is one
+# atomic batch; a torn or corrupt frame at the end is discarded on open.
+LOG_FRAME = struct.Struct(">II")
+LOG_COUNT = struct.Struct(">I")
+LOG_ENTRY = struct.Struct(">QI")
+
+
+def hash_key(block_hash):
+    """
+    Fixed-size key for a block hash of any type (hex string or chameleon hash int).
+    """
+    return hashlib.sha256(str(block_hash).encode()).digest()
+
+
+class BlockStore:
+    def __init__(self, directory, encode, decode, segment_size=64 * 1024 * 1024, read_only=False):
+        """
+        Append-only block storage. Serialized blocks are appended to numbered
+        segment files, reads go through memory-mapped segments, and an index
+        file with one fixed-width entry per height gives O(1) lookup by height.
+        The hash -> height index is rebuilt from the index file on open.
+
+        Blocks rewritten in place (redactions) go to an append-only redaction
+        log that overlays the segments, so a rewrite costs O(block size) I/O;
+        compact() later folds the log back into the affected segments only.
+
+        With read_only the store is a reader next to the process that writes it
+        (e.g. a validation worker): nothing is recovered, truncated or written,
+        and the hash index is only built on the first lookup by hash.
+        """
+        self.directory = directory
+        self.encode = encode  # Block -> bytes
+        self.decode = decode  # bytes -> Block
+        self.segment_size = segment_size
+        self.read_only = read_only
+
+        self._lock = threading.RLock()
+        self._maps = {}  # segment number -> mmap
+        self._heights = None if read_only else {}  # hash_key -> height
+        self._overlay = {}  # height -> (offset, length) of the latest record in the redaction log
+        self._compactor = None
+
+        index_path = os.path.join(directory, "index.dat")
+        log_path = os.path.join(directory, "redactions.log")
+        if read_only:
+            self._index = open(index_path, "rb")
+            self._index_writer = None
+            self._writer = None
+            self._load_index()
+            self._log = open(log_path, "rb")
+            self._load_log()
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._index = open(index_path, "a+b")
+        self._index_writer = os.open(index_path, os.O_WRONLY)  # Not O_APPEND, for in-place updates
+        self._recover_compaction()
+        self._load_index()
+        self._open_active_segment()
+        self._log = open(log_path, "a+b")
+        self._load_log()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:05d}.dat")
+
+    def _load_index(self):
+        """
+        Rebuild the hash index and drop a partially written trailing entry.
+        """
+        self._index.seek(0)
+        data = self._index.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        if usable != len(data) and not self.read_only:
+            self._index.truncate(usable)
+        self._length = usable // INDEX_ENTRY.size
+        if self._heights is not None:
+            self._index_heights(data)
+
+    def _index_heights(self, data):
+        self._heights = {}
+        for height in range(self._length):
+            key = INDEX_ENTRY.unpack_from(data, height * INDEX_ENTRY.size)[3]
+            self._heights[key] = height
+
+    def _open_active_segment(self):
+        """
+        Open the last segment for appending, cutting off any record that was
+        written but never made it into the index.
+        """
+        if self._length:
+            segment, offset, length, _ = self._entry(self._length - 1)
+            end = offset + RECORD_HEADER.size + length
+        else:
+            segment, end = 0, 0
+        self._segment = segment
+        self._writer = open(self._segment_path(segment), "a+b")
+        if self._writer.seek(0, os.SEEK_END) > end:
+            self._writer.truncate(end)
+        self._offset = end
+        # Later segments can only be left over from a truncate() interrupted by a crash
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".dat") and int(name[8:-4]) > segment:
+                os.remove(os.path.join(self.directory, name))
+
+    def _load_log(self):
+        """
+        Replay the redaction log into the in-memory overlay, truncating a torn last frame.
+        """
+        self._log.seek(0)
+        data = self._log.read()
+        position = 0
+        while position + LOG_FRAME.size <= len(data):
+            length, checksum = LOG_FRAME.unpack_from(data, position)
+            start = position + LOG_FRAME.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            count, = LOG_COUNT.unpack_from(payload, 0)
+            offset = LOG_COUNT.size
+            for _ in range(count):
+                height, record_length = LOG_ENTRY.unpack_from(payload, offset)
+                offset += LOG_ENTRY.size
+                self._overlay[height] = (start + offset, record_length)
+                offset += record_length
+            position = start + length
+        if position != len(data) and not self.read_only:
+            self._log.truncate(position)
+
+    def _entry(self, height):
+        return INDEX_ENTRY.unpack(os.pread(self._index.fileno(), INDEX_ENTRY.size, height * INDEX_ENTRY.size))
+
+    def _map(self, segment, end):
+        """
+        Return a memory map of the segment that covers at least `end` bytes.
+        """
+        segment_map = self._maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            with open(self._segment_path(segment), "rb") as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map
+
+    def _read_base(self, height):
+        segment, offset, length, _ = self._entry(height)
+        start = offset + RECORD_HEADER.size
+        return self._map(segment, start + length)[start:start + length]
+
+    def read_record(self, height):
+        """
+        Return the raw serialized record stored at the given height, with redactions applied.
+        """
+        with self._lock:
+            if height in self._overlay:
+                offset, length = self._overlay[height]
+                return os.pread(self._log.fileno(), length, offset)
+            return self._read_base(height)
+
+    def __len__(self):
+        return self._length
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("Block store is open read-only.")
+
+    def append(self, block):
+        self._check_writable()
+        record = self.encode(block)
+        with self._lock:
+            if self._offset and self._offset + RECORD_HEADER.size + len(record) > self.segment_size:
+                self._writer.close()
+                self._segment += 1
+                self._writer = open(self._segment_path(self._segment), "a+b")
+                self._offset = 0
+
+            # The record goes to disk before its index entry, so a crash in between
+            # leaves an unindexed tail that _open_active_segment() discards.
+            self._writer.write(RECORD_HEADER.pack(len(record)) + record)
+            self._writer.flush()
+            key = hash_key(block.hash)
+            self._index.write(INDEX_ENTRY.pack(self._segment, self._offset, len(record), key))
+            self._index.flush()
+
+            self._heights[key] = self._length
+            self._offset += RECORD_HEADER.size + len(record)
+            self._length += 1
+
+    def rewrite(self, height, block):
+        self.rewrite_many([(height, block)])
+
+    def rewrite_many(self, blocks):
+        """
+        Replace the stored records of already appended blocks, e.g. after a
+        redaction. Only the new records are written, as one atomic frame in the
+        redaction log; the block hashes must not change.
+        """
+        self._check_writable()
+        blocks = list(blocks)
+        records = [(height, self.encode(block)) for height, block in blocks]
+        with self._lock:
+            for height, block in blocks:
+                if not 0 <= height < self._length:
+                    raise IndexError("Block height out of range.")
+                if self._entry(height)[3] != hash_key(block.hash):
+                    raise ValueError("Rewritten block must keep its hash.")
+
+            payload = bytearray(LOG_COUNT.pack(len(records)))
+            positions = []
+            for height, record in records:
+                payload += LOG_ENTRY.pack(height, len(record))
+                positions.append((height, len(payload), len(record)))
+                payload += record
+
+            start = self._log.seek(0, os.SEEK_END) + LOG_FRAME.size
+            self._log.write(LOG_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._log.flush()
+            for height, offset, length in positions:
+                self._overlay[height] = (start + offset, length)
+
+    def truncate(self, length):
+        """
+        Drop every block at height >= length, e.g. to rewind to a fork point
+        during a reorg. Redactions above the cut are compacted away first, so the
+        redaction log never overlays blocks appended at those heights later.
+        """
+        self._check_writable()
+        with self._lock:
+            if not 0 <= length <= self._length:
+                raise IndexError("Block height out of range.")
+            if length == self._length:
+                return
+            if any(height >= length for height in self._overlay):
+                self.compact()
+            for height in range(length, self._length):
+                del self._heights[self._entry(height)[3]]
+            if length:
+                segment, offset, record_length, _ = self._entry(length - 1)
+                end = offset + RECORD_HEADER.size + record_length
+            else:
+                segment, end = 0, 0
+
+            # The index is cut first; segment bytes past it are discarded on open anyway
+            self._index.truncate(length * INDEX_ENTRY.size)
+            self._writer.close()
+            for stale in range(segment, self._segment + 1):
+                if stale in self._maps:
+                    self._maps.pop(stale).close()
+                if stale > segment:
+                    os.remove(self._segment_path(stale))
+            self._segment = segment
+            self._writer = open(self._segment_path(segment), "a+b")
+            self._writer.truncate(end)
+            self._offset = end
+            self._length = length
+
+    def get(self, height):
+        if not 0 <= height < self._length:
+            raise IndexError("Block height out of range.")
+        return self.decode(self.read_record(height))
+
+    def height_of(self, block_hash):
+        """
+        Return the height of the block with this hash, or None.
+        """
+        if self._heights is None:
+            with self._lock:
+                self._index.seek(0)
+                self._index_heights(self._index.read(self._length * INDEX_ENTRY.size))
+        return self._heights.get(hash_key(block_hash))
+
+    def get_by_hash(self, block_hash):
+        height = self.height_of(block_hash)
+        return None if height is None else self.get(height)
+
+    def _journal_path(self):
+        return os.path.join(self.directory, "compaction.journal")
+
+    def _recover_compaction(self):
+        """
+        Finish or roll back a compaction interrupted by a crash. If the new
+        segment already replaced the old one, the journalled index entries are
+        replayed; otherwise the old segment is intact and the attempt is dropped.
+        """
+        journal_path = self._journal_path()
+        if not os.path.exists(journal_path):
+            return
+        with open(journal_path) as f:
+            journal = json.load(f)
+        temporary = self._segment_path(journal["segment"]) + ".compact"
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        else:
+            for height, offset, length in journal["entries"]:
+                self._write_entry_location(height, journal["segment"], offset, length)
+            os.fsync(self._index_writer)
+        os.remove(journal_path)
+
+    def _write_entry_location(self, height, segment, offset, length):
+        key = INDEX_ENTRY.unpack(os.pread(self._index.fileno(), INDEX_ENTRY.size, height * INDEX_ENTRY.size))[3]
+        os.pwrite(self._index_writer, INDEX_ENTRY.pack(segment, offset, length, key), height * INDEX_ENTRY.size)
+
+    def _segment_heights(self, segment):
+        """
+        Return the range of heights stored in a segment (segments hold consecutive heights).
+        """
+        low, high = 0, self._length
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < segment:
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+        high = self._length
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] <= segment:
+                low = middle + 1
+            else:
+                high = middle
+        return range(first, low)
+
+    def compact(self):
+        """
+        Fold the redaction log back into the segments. Only segments containing
+        redacted blocks are rewritten; the log is emptied afterwards.
+        """
+        self._check_writable()
+        with self._lock:
+            if not self._overlay:
+                return
+            segments = sorted({self._entry(height)[0] for height in self._overlay})
+            for segment in segments:
+                self._compact_segment(segment)
+            self._overlay = {}
+            self._log.truncate(0)
+            self._log.flush()
+
+    def _compact_segment(self, segment):
+        temporary = self._segment_path(segment) + ".compact"
+        entries = []
+        offset = 0
+        with open(temporary, "wb") as f:
+            for height in self._segment_heights(segment):
+                record = self.read_record(height)
+                f.write(RECORD_HEADER.pack(len(record)) + record)
+                entries.append((height, offset, len(record)))
+                offset += RECORD_HEADER.size + len(record)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self._journal_path(), "w") as f:
+            json.dump({"segment": segment, "entries": entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if segment in self._maps:
+            self._maps.pop(segment).close()
+        if segment == self._segment:
+            self._writer.close()
+        os.replace(temporary, self._segment_path(segment))
+        for height, entry_offset, length in entries:
+            self._write_entry_location(height, segment, entry_offset, length)
+        os.fsync(self._index_writer)
+        os.remove(self._journal_path())
+
+        if segment == self._segment:
+            self._writer = open(self._segment_path(segment), "a+b")
+            self._offset = offset
+
+    def start_compactor(self, interval=60.0, threshold=16 * 1024 * 1024):
+        """
+        Compact in a background thread whenever the redaction log grows past `threshold` bytes.
+        """
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                if os.path.getsize(self._log.name) > threshold:
+                    self.compact()
+
+        self._compactor = (stop, threading.Thread(target=run, daemon=True))
+        self._compactor[1].start()
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor[0].set()
+            self._compactor[1].join()
+            self._compactor = None
+        with self._lock:
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps = {}
+            self._log.close()
+            self._index.close()
+            if not self.read_only:
+                self._writer.close()
+                os.close(self._index_writer)
+
+
+class StoredChain:
+    def __init__(self, store):
+        """
+        List-like view over a BlockStore so Blockchain code written against
+        self.chain (len, indexing, slicing, iteration, append, item assignment)
+        keeps working while blocks stay on disk until they are accessed.
+        """
+        self.store = store
+
+    def __reduce__(self):
+        # Pickled for another process (a validation worker), the chain is reopened read-only by path
+        return open_read_only, (self.store.directory, self.store.encode, self.store.decode)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.store.get(height) for height in range(*item.indices(len(self.store)))]
+        if item < 0:
+            item += len(self.store)
+        return self.store.get(item)
+
+    def __setitem__(self, height, block):
+        self.store.rewrite(height, block)
+
+    def __delitem__(self, item):
+        if not isinstance(item, slice) or item.stop is not None or item.step is not None:
+            raise TypeError("Only the tail of a stored chain can be deleted, as in del chain[height:].")
+        self.store.truncate(range(*item.indices(len(self.store))).start)
+
+    def __iter__(self):
+        for height in range(len(self.store)):
+            yield self.store.get(height)
+
+    def append(self, block):
+        self.store.append(block)
+
+
+def open_read_only(directory, encode, decode):
+    """
+    Open a stored chain for reading only, e.g. in a worker process.
+    """
+    return StoredChain(BlockStore(directory, encode, decode, read_only=True))
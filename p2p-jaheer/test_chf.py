@@ -0,0 +1,85 @@
+import secrets
+
+from chf import Block, Blockchain, ChameleonHash, verify_inclusion
+from params import MODP_PRIMES
+
+
+def make_chameleon_hash():
+    p = MODP_PRIMES[2048]
+    q = (p - 1) // 2
+    secret_key = secrets.randbelow(q - 1) + 1
+    return ChameleonHash(4, pow(4, secret_key, p), p, secret_key, q)
+
+
+def test_tampered_merkle_body_is_rejected(tmp_path):
+    chf = make_chameleon_hash()
+    blockchain = Blockchain(chf, store_path=str(tmp_path))
+    blockchain.add_block(["a", "b", "c"])
+    blockchain.add_block(["d"])
+    assert blockchain.is_chain_valid()
+
+    # Without the trapdoor: append a transaction, keeping the recorded hash and leaf randomness
+    block = blockchain.chain[1]
+    forged = Block.__new__(Block)
+    for name in Block.__slots__:
+        setattr(forged, name, getattr(block, name))
+    forged.data = block.data + ["forged tx"]
+    blockchain.chain[1] = forged
+    assert not blockchain.is_chain_valid(start=1)
+    assert blockchain.find_invalid_block() == 1
+
+    # Dropping a transaction together with its randomness changes the root
+    blockchain.chain[1] = Block(1, block.previous_hash, ["a", "b"], chf, block.r, block.timestamp, block.hash,
+                                block.rs[:2])
+    assert blockchain.find_invalid_block() == 1
+
+
+def test_leaf_count_must_match():
+    chf = make_chameleon_hash()
+    try:
+        Block(1, "0", ["a", "b"], chf, rs=[1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Block accepted a body without one leaf randomness value per transaction.")
+
+    block = Block(1, "0", ["a", "b", "c"], chf)
+    proof = block.inclusion_proof(2)
+    assert verify_inclusion(chf, "c", proof, block.merkle_root(), block.r, block.hash)
+    assert not verify_inclusion(chf, "c", (proof[0], proof[1], 4), block.merkle_root(), block.r, block.hash)
+
+
+def test_batch_verify_rejects_hashes_outside_the_subgroup():
+    chf = make_chameleon_hash()
+    items = [(chf.exponent(data), r, chf.hash(data, r)) for data, r in ((1, 2), (3, 4), (5, 6))]
+    assert chf.batch_verify(items)
+    # Two negated hashes cancel out in the product whenever both coefficients are odd
+    forged = [(data, r, chf.p - chameleon_hash if position < 2 else chameleon_hash)
+              for position, (data, r, chameleon_hash) in enumerate(items)]
+    for _ in range(20):
+        assert not chf.batch_verify(forged)
+    assert chf.find_invalid(forged) == 0
+
+
+def test_payload_forgery_and_in_place_edits_are_rejected():
+    chf = make_chameleon_hash()
+    blockchain = Blockchain(chf)
+    blockchain.add_block(10)
+    blockchain.add_block(["a", "b"])
+    blockchain.add_block({"k": 1})
+    assert blockchain.is_chain_valid(start=1)
+
+    # An integer payload is hashed like any other, so its own exponent does not stand in for it
+    original = blockchain.chain[1].data
+    blockchain.chain[1].data = chf.exponent(original)
+    assert blockchain.find_invalid_block() == 1
+    blockchain.chain[1].data = original + chf.q
+    assert blockchain.find_invalid_block() == 1
+    blockchain.chain[1].data = original
+    assert blockchain.find_invalid_block() is None
+
+    blockchain.chain[2].data[0] = "evil"
+    assert blockchain.find_invalid_block() == 2
+    blockchain.chain[2].data[0] = "a"
+    blockchain.chain[3].data["k"] = 2
+    assert blockchain.find_invalid_block() == 3
@@ -0,0 +1,120 @@
+import os
+import pickle
+
+from blockchain import GENESIS_TIMESTAMP, Block
+from store import INDEX_ENTRY, BlockStore
+
+
+def open_store(path):
+    return BlockStore(str(path), Block.serialize, Block.deserialize)
+
+
+def make_blocks(count):
+    blocks = [Block(0, "0", "Genesis Block", GENESIS_TIMESTAMP)]
+    for height in range(1, count):
+        blocks.append(Block(height, blocks[-1].hash, [f"tx {height}"], GENESIS_TIMESTAMP + height))
+    return blocks
+
+
+def redacted(block, data):
+    # Same hash, new body: what a redaction writes back for a chameleon-hashed block
+    return Block(block.index, block.previous_hash, data, block.timestamp, block.nonce, block.target, block.hash)
+
+
+def test_torn_tail_is_dropped_on_reopen(tmp_path):
+    store = open_store(tmp_path)
+    blocks = make_blocks(5)
+    for block in blocks:
+        store.append(block)
+    store.close()
+
+    # A crash mid-append: record bytes without an index entry, and half an index entry
+    with open(tmp_path / "segment-00000.dat", "ab") as f:
+        f.write(b"\x00\x00\x00\x40torn record")
+    with open(tmp_path / "index.dat", "ab") as f:
+        f.write(b"\x00" * (INDEX_ENTRY.size // 2))
+
+    store = open_store(tmp_path)
+    assert len(store) == 5
+    assert os.path.getsize(tmp_path / "index.dat") == 5 * INDEX_ENTRY.size
+    extra = Block(5, blocks[-1].hash, ["tx 5"], GENESIS_TIMESTAMP + 5)
+    store.append(extra)
+    assert [store.get(height).hash for height in range(6)] == [block.hash for block in blocks + [extra]]
+    assert store.height_of(extra.hash) == 5
+    store.close()
+
+
+def test_redaction_log_frame_with_bad_crc_is_discarded(tmp_path):
+    store = open_store(tmp_path)
+    blocks = make_blocks(4)
+    for block in blocks:
+        store.append(block)
+    store.rewrite(1, redacted(blocks[1], ["first"]))
+    first_frame = os.path.getsize(tmp_path / "redactions.log")
+    store.rewrite(2, redacted(blocks[2], ["second"]))
+    store.close()
+
+    # Flip the last byte of the second frame's payload
+    with open(tmp_path / "redactions.log", "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    store = open_store(tmp_path)
+    assert store.get(1).data == ["first"]
+    assert store.get(2).data == blocks[2].data
+    assert os.path.getsize(tmp_path / "redactions.log") == first_frame
+    store.close()
+
+
+def test_interrupted_compaction_is_rolled_back_or_finished(tmp_path, monkeypatch):
+    store = open_store(tmp_path)
+    blocks = make_blocks(6)
+    for block in blocks:
+        store.append(block)
+    store.rewrite(3, redacted(blocks[3], ["a much longer redacted body than before"]))
+
+    # Crash before the compacted segment replaced the old one: the attempt is dropped
+    def crash(*args):
+        raise OSError("crash")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "replace", crash)
+        try:
+            store.compact()
+        except OSError:
+            pass
+    assert os.path.exists(tmp_path / "compaction.journal")
+    store = open_store(tmp_path)
+    assert not os.path.exists(tmp_path / "compaction.journal")
+    assert not os.path.exists(tmp_path / "segment-00000.dat.compact")
+    assert store.get(3).data == ["a much longer redacted body than before"]
+
+    # Crash after the replace but before the index was updated: the journal is replayed
+    with monkeypatch.context() as patch:
+        patch.setattr(BlockStore, "_write_entry_location", crash)
+        try:
+            store.compact()
+        except OSError:
+            pass
+    store = open_store(tmp_path)
+    assert not os.path.exists(tmp_path / "compaction.journal")
+    assert [store.get(height).hash for height in range(6)] == [block.hash for block in blocks]
+    assert store.get(3).data == ["a much longer redacted body than before"]
+    assert store.get(4).data == blocks[4].data
+    store.close()
+
+
+def test_records_are_not_unpickled(tmp_path):
+    class Payload:
+        def __reduce__(self):
+            return os.system, ("echo pwned > " + str(tmp_path / "pwned"),)
+
+    try:
+        Block.deserialize(pickle.dumps(Payload()))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A pickled record was accepted.")
+    assert not os.path.exists(tmp_path / "pwned")
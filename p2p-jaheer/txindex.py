@@ -0,0 +1,97 @@
+import struct
+
+# One fixed-width log entry: operation, block height, position in the block and transaction id
+INDEX_ENTRY = struct.Struct(">BQI32s")
+ADD = 1
+REMOVE = 2
+BLOCK = 3  # Every transaction of the block at this height has been added
+WHOLE_PAYLOAD = 0xFFFFFFFF  # Stored position of a payload that is not a list of transactions
+
+
+class TransactionIndex:
+    def __init__(self, path=None):
+        """
+        Secondary index from a 32-byte transaction id to every (block height,
+        position) holding that transaction, for O(1) lookups. Position is None
+        for a payload that is not a list of transactions. With a path, changes
+        are appended to a log of fixed-width entries that is replayed on open.
+        """
+        self.path = path
+        self.locations = {}  # transaction id -> [(height, position), ...]
+        self.height = 0  # Blocks below this height are indexed
+        self._log = None
+        if path is not None:
+            self._log = open(path, "a+b")
+            self._load()
+
+    def _load(self):
+        """
+        Replay the log, dropping a partially written trailing entry.
+        """
+        self._log.seek(0)
+        data = self._log.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        if usable != len(data):
+            self._log.truncate(usable)
+        for operation, height, position, key in INDEX_ENTRY.iter_unpack(data[:usable]):
+            self._apply(operation, height, None if position == WHOLE_PAYLOAD else position, key)
+
+    def _apply(self, operation, height, position, key):
+        if operation == BLOCK:
+            self.height = max(self.height, height + 1)
+            return
+        location = (height, position)
+        locations = self.locations.get(key)
+        if operation == ADD:
+            if locations is None:
+                self.locations[key] = [location]
+            elif location not in locations:  # Re-added after a crash before the block was marked
+                locations.append(location)
+        elif locations is not None and location in locations:
+            locations.remove(location)
+            if not locations:
+                del self.locations[key]
+
+    def _write(self, entries):
+        if self._log is not None:
+            self._log.write(b"".join(INDEX_ENTRY.pack(operation, height,
+                                                      WHOLE_PAYLOAD if position is None else position, key)
+                                     for operation, height, position, key in entries))
+            self._log.flush()
+        for entry in entries:
+            self._apply(*entry)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, key):
+        return key in self.locations
+
+    def add_block(self, height, keys):
+        """
+        Index the (position, transaction id) pairs of the block at `height`.
+        """
+        entries = [(ADD, height, position, key) for position, key in keys]
+        entries.append((BLOCK, height, 0, bytes(32)))
+        self._write(entries)
+
+    def update(self, height, old_keys, new_keys):
+        """
+        Re-index a redacted block from its old and new (position, transaction id) pairs.
+        """
+        old_keys, new_keys = set(old_keys), set(new_keys)
+        self._write([(REMOVE, height, position, key) for position, key in old_keys - new_keys] +
+                    [(ADD, height, position, key) for position, key in new_keys - old_keys])
+
+    def get(self, key):
+        """
+        Return the (height, position) locations of a transaction id, empty if it is unknown.
+        """
+        return list(self.locations.get(key, ()))
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import struct
+
+import blockchain  # Module import: blockchain -> mempool -> wire is a cycle
+
+# Every message starts with the format version and a message type
+VERSION = 1
+MESSAGE_HEADER = struct.Struct(">BB")
+MSG_BLOCK = 1
+MSG_TRANSACTION = 2
+MSG_HELLO = 3    # [host, port] the sender listens on, sent first on every outgoing connection
+MSG_INV = 4      # Announces items by (type, hash)
+MSG_GETDATA = 5  # Requests announced items by (type, hash)
+MSG_GETHEADERS = 6  # [start height, count]
+MSG_HEADERS = 7     # Block headers without bodies, answering MSG_GETHEADERS
+MSG_GETBLOCKS = 8   # [start height, count]
+MSG_BLOCKS = 9      # Full blocks, answering MSG_GETBLOCKS
+
+INVENTORY_ITEM = struct.Struct(">B32s")
+
+# Fixed-width block header: flags, index, previous hash, timestamp, nonce,
+# target - 1 (so 2^256 fits in 32 bytes) and the block hash, hashes as raw bytes
+BLOCK_HEADER = struct.Struct(">BQ32sdQ32s32s")
+FLAG_TEXT_PREVIOUS_HASH = 1  # previous_hash is not 64 hex digits (e.g. a genesis "0"); sent as a string value
+
+FLOAT = struct.Struct(">d")
+
+
+def encode_varint(value, out):
+    """
+    Appends an unsigned LEB128 varint: 7 bits per byte, high bit set on all but the last.
+    """
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_value(value, out):
+    """
+    Appends a block body or transaction: a type tag, then a varint length or
+    count where needed. Lists and dicts keep their order, because the block hash
+    is taken over str(data).
+    """
+    if isinstance(value, str):
+        payload = value.encode()
+        out.append(0x73)  # "s"
+        encode_varint(len(payload), out)
+        out += payload
+    elif isinstance(value, bool):
+        out.append(0x54 if value else 0x46)  # "T" / "F"
+    elif isinstance(value, int):
+        out.append(0x69)  # "i", zigzag so small negative numbers stay short
+        encode_varint(value * 2 if value >= 0 else -value * 2 - 1, out)
+    elif isinstance(value, float):
+        out.append(0x66)  # "f"
+        out += FLOAT.pack(value)
+    elif value is None:
+        out.append(0x6E)  # "n"
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(0x62)  # "b"
+        encode_varint(len(value), out)
+        out += value
+    elif isinstance(value, list):
+        out.append(0x6C)  # "l"
+        encode_varint(len(value), out)
+        for item in value:
+            encode_value(item, out)
+    elif isinstance(value, dict):
+        out.append(0x64)  # "d"
+        encode_varint(len(value), out)
+        for key, item in value.items():
+            encode_value(key, out)
+            encode_value(item, out)
+    else:
+        raise TypeError(f"Unsupported wire value type: {type(value).__name__}")
+
+
+def decode_value(data, offset):
+    tag = data[offset]
+    offset += 1
+    if tag == 0x73:
+        length, offset = decode_varint(data, offset)
+        return bytes(data[offset:offset + length]).decode(), offset + length
+    if tag == 0x69:
+        value, offset = decode_varint(data, offset)
+        return (value >> 1 if not value & 1 else -(value >> 1) - 1), offset
+    if tag == 0x66:
+        return FLOAT.unpack_from(data, offset)[0], offset + FLOAT.size
+    if tag == 0x6C:
+        count, offset = decode_varint(data, offset)
+        items = []
+        for _ in range(count):
+            # Short strings (the usual transaction) are decoded inline, without a call per item
+            if data[offset] == 0x73 and data[offset + 1] < 0x80:
+                end = offset + 2 + data[offset + 1]
+                items.append(bytes(data[offset + 2:end]).decode())
+                offset = end
+            else:
+                item, offset = decode_value(data, offset)
+                items.append(item)
+        return items, offset
+    if tag == 0x64:
+        count, offset = decode_varint(data, offset)
+        items = {}
+        for _ in range(count):
+            key, offset = decode_value(data, offset)
+            items[key], offset = decode_value(data, offset)
+        return items, offset
+    if tag == 0x62:
+        length, offset = decode_varint(data, offset)
+        return bytes(data[offset:offset + length]), offset + length
+    if tag in (0x54, 0x46):
+        return tag == 0x54, offset
+    if tag == 0x6E:
+        return None, offset
+    raise ValueError(f"Unknown wire value tag {tag:#x}.")
+
+
+def encode_header(block, out):
+    flags = 0
+    previous_hash = block.previous_hash
+    if len(previous_hash) == 64:
+        previous_raw = bytes.fromhex(previous_hash)
+    else:
+        flags |= FLAG_TEXT_PREVIOUS_HASH
+        previous_raw = bytes(32)
+    out += BLOCK_HEADER.pack(flags, block.index, previous_raw, block.timestamp, block.nonce,
+                             (block.target - 1).to_bytes(32, "big"), bytes.fromhex(block.hash))
+    if flags & FLAG_TEXT_PREVIOUS_HASH:
+        encode_value(previous_hash, out)
+
+
+def encode_block(block, out):
+    encode_header(block, out)
+    encode_value(block.data, out)
+
+
+def decode_header(data, offset):
+    """
+    Returns a Block without its body (data is None) and the offset after the header.
+    """
+    flags, index, previous_raw, timestamp, nonce, target, block_hash = BLOCK_HEADER.unpack_from(data, offset)
+    offset += BLOCK_HEADER.size
+    if flags & FLAG_TEXT_PREVIOUS_HASH:
+        previous_hash, offset = decode_value(data, offset)
+    else:
+        previous_hash = previous_raw.hex()
+    block = blockchain.Block(index, previous_hash, None, timestamp, nonce, int.from_bytes(target, "big") + 1,
+                  block_hash.hex())
+    return block, offset
+
+
+def decode_block(data, offset):
+    block, offset = decode_header(data, offset)
+    block.data, offset = decode_value(data, offset)
+    return block, offset
+
+
+# How the list messages encode each element
+LIST_CODECS = {MSG_HEADERS: (encode_header, decode_header), MSG_BLOCKS: (encode_block, decode_block)}
+
+
+def transaction_hash(transaction):
+    """
+    Returns the 32-byte id of a transaction: SHA-256 of its wire encoding.
+    """
+    out = bytearray()
+    encode_value(transaction, out)
+    return hashlib.sha256(out).digest()
+
+
+def encode_message(kind, value):
+    """
+    Returns a framed message body: version, type, then the encoded block,
+    inventory list of (type, 32-byte hash) or other value.
+    """
+    out = bytearray(MESSAGE_HEADER.pack(VERSION, kind))
+    if kind == MSG_BLOCK:
+        encode_block(value, out)
+    elif kind in (MSG_INV, MSG_GETDATA):
+        encode_varint(len(value), out)
+        for item_kind, item_hash in value:
+            out += INVENTORY_ITEM.pack(item_kind, item_hash)
+    elif kind in LIST_CODECS:
+        encode_varint(len(value), out)
+        for block in value:
+            LIST_CODECS[kind][0](block, out)
+    else:
+        encode_value(value, out)
+    return bytes(out)
+
+
+def decode_message(data):
+    """
+    Returns (type, value) for a message produced by encode_message.
+    """
+    version, kind = MESSAGE_HEADER.unpack_from(data, 0)
+    if version != VERSION:
+        raise ValueError(f"Unsupported wire format version {version}.")
+    if kind == MSG_BLOCK:
+        value, offset = decode_block(data, MESSAGE_HEADER.size)
+    elif kind in (MSG_INV, MSG_GETDATA):
+        count, offset = decode_varint(data, MESSAGE_HEADER.size)
+        value = []
+        for _ in range(count):
+            value.append(INVENTORY_ITEM.unpack_from(data, offset))
+            offset += INVENTORY_ITEM.size
+    elif kind in LIST_CODECS:
+        count, offset = decode_varint(data, MESSAGE_HEADER.size)
+        value = []
+        for _ in range(count):
+            block, offset = LIST_CODECS[kind][1](data, offset)
+            value.append(block)
+    else:
+        value, offset = decode_value(data, MESSAGE_HEADER.size)
+    if offset != len(data):
+        raise ValueError("Trailing bytes after wire message.")
+    return kind, value
+
+
+def benchmark(rounds=20000, transactions=10):
+    """
+    Compares message size and encode/decode rate of the binary format against
+    the previous JSON messages, for a block carrying `transactions` short
+    transactions and for a single transaction.
+    """
+    import time
+
+    Block = blockchain.Block
+    block = Block(12345, "ab" * 32, [f"Alice pays Bob {i} coins" for i in range(transactions)],
+                  1700000000.123, 987654, 1 << 236)
+
+    def json_encode(item):
+        if isinstance(item, Block):
+            return json.dumps({"type": "block", "block": item.to_dict()}).encode()
+        return json.dumps({"type": "transaction", "transaction": item}).encode()
+
+    def json_decode(message):
+        message = json.loads(message)
+        if message["type"] == "block":
+            return Block(**message["block"])
+        return message["transaction"]
+
+    for name, item, kind in (("block", block, MSG_BLOCK), ("transaction", block.data[0], MSG_TRANSACTION)):
+        results = []
+        for encode, decode in ((json_encode, json_decode),
+                               (lambda value: encode_message(kind, value),
+                                lambda message: decode_message(message)[1])):
+            message = encode(item)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                encode(item)
+            encoded = rounds / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                decoded = decode(message)
+            decoded_rate = rounds / (time.perf_counter() - start)
+            if isinstance(decoded, Block):
+                assert decoded.hash == decoded.compute_hash() == item.hash
+            results.append(f"{len(message)} B, encode {encoded:,.0f}/s, decode {decoded_rate:,.0f}/s")
+        print(f"{name:>11}: json {results[0]} | binary {results[1]}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,66 +1,243 @@
 import hashlib
+import threading
 import time
+from collections import deque
+
+from mempool import MAX_BLOCK_TRANSACTIONS, Mempool
+
+MAX_TARGET = 1 << 256  # SHA-256 digests are compared as 256-bit big-endian integers
+GENESIS_TIMESTAMP = 1700000000.0  # Fixed so every node starts from the same genesis block
+MEDIAN_TIME_BLOCKS = 11  # A block must be later than the median timestamp of this many blocks before it
+MAX_FUTURE_DRIFT = 120.0  # Seconds a block's timestamp may run ahead of our clock
+
+def target_from_bits(bits):
+    """
+    Returns the target a block hash must stay below to carry `bits` leading zero bits.
+    """
+    return MAX_TARGET >> bits
+
+def hash_meets_target(block_hash, target):
+    """
+    Checks a hex block hash against a 256-bit integer target.
+    """
+    return int(block_hash, 16) < target
+
+def block_work(target):
+    """
+    Expected number of hashes needed to find a block below target.
+    """
+    return MAX_TARGET // target
+
+def recent_timestamps(chain, height):
+    """
+    Timestamps of the (up to MEDIAN_TIME_BLOCKS) blocks below `height`, as a
+    bounded deque a validation loop extends block by block.
+    """
+    return deque((chain[previous].timestamp for previous in range(max(height - MEDIAN_TIME_BLOCKS, 0), height)),
+                 maxlen=MEDIAN_TIME_BLOCKS)
+
+def timestamp_is_valid(timestamp, recent, now=None):
+    """
+    A block's timestamp must be later than the median of `recent` and at most
+    MAX_FUTURE_DRIFT seconds ahead of our clock, so it cannot be set freely to
+    ease the next retarget.
+    """
+    ordered = sorted(recent)
+    now = time.time() if now is None else now
+    return ordered[len(ordered) // 2] < timestamp <= now + MAX_FUTURE_DRIFT
 
 class Block:
-    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0):
+    # No per-instance __dict__: at millions of blocks the dict overhead dominates memory
+    __slots__ = ("index", "previous_hash", "data", "timestamp", "nonce", "target", "hash")
+
+    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0, target=MAX_TARGET, hash=None):
         self.index = index
         self.previous_hash = previous_hash
         self.data = data
         self.timestamp = timestamp or time.time()
         self.nonce = nonce
-        self.hash = self.compute_hash()
+        self.target = target  # Proof-of-work target this block was mined against
+        self.hash = hash if hash is not None else self.compute_hash()
+
+    def to_dict(self):
+        """
+        Returns the block's fields, e.g. for JSON serialization.
+        """
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def hash_prefix(self):
+        """
+        Returns the part of the hashed block string that does not depend on the nonce.
+        """
+        return f"{self.index}{self.previous_hash}{self.data}{self.timestamp}{self.target}"
+
+    def midstate(self):
+        """
+        Returns a SHA-256 object that has already absorbed the hash prefix, so a
+        candidate nonce only needs a copy() and an update() with its own bytes.
+        """
+        return hashlib.sha256(self.hash_prefix().encode())
 
     def compute_hash(self):
         """
         Creates a SHA-256 hash of the block's contents.
         """
-        block_string = f"{self.index}{self.previous_hash}{self.data}{self.timestamp}{self.nonce}"
+        block_string = f"{self.hash_prefix()}{self.nonce}"
         return hashlib.sha256(block_string.encode()).hexdigest()
 
-    def mine_block(self, difficulty):
+    def mine_block(self, target, miner=None, cancel=None):
+        """
+        Mines the block by adjusting the nonce until the raw digest, read as an integer, is below target.
+        If a miner (e.g. miner.ParallelMiner) is given, the nonce search is delegated to it.
+        If the threading.Event `cancel` is set the search stops early and the hash is left unchanged.
+        Returns the number of hashes tried.
+        """
+        if miner is not None:
+            result = miner.mine(self, target, cancel)
+            if result is not None:
+                self.nonce, self.hash = result
+            return miner.attempts
+        midstate = self.midstate()
+        nonce = start = self.nonce
+        while True:
+            if cancel is not None and nonce % 4096 == 0 and cancel.is_set():
+                return nonce - start
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            if int.from_bytes(attempt.digest(), 'big') < target:
+                break
+            nonce += 1
+        self.nonce = nonce
+        self.hash = attempt.hexdigest()  # Hex conversion only once, for the winning attempt
+        return nonce - start + 1
+
+class ForkView:
+    def __init__(self, chain, fork_height, suffix):
         """
-        Mines the block by adjusting the nonce until the hash starts with the required number of zeros.
+        Read-only view of chain[:fork_height] followed by a candidate suffix, so
+        the suffix can be validated (retargeting included) without copying the
+        shared prefix.
         """
-        target = '0' * difficulty  # Create target hash with difficulty number of leading zeros
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.compute_hash()
+        self.chain = chain
+        self.fork_height = fork_height
+        self.suffix = suffix
+
+    def __len__(self):
+        return self.fork_height + len(self.suffix)
+
+    def __getitem__(self, height):
+        if height < 0:
+            height += len(self)
+        if height < self.fork_height:
+            return self.chain[height]
+        return self.suffix[height - self.fork_height]
 
 class Blockchain:
-    def __init__(self, difficulty=4):
+    def __init__(self, difficulty=4, miner=None, target=None, retargeter=None, validator=None,
+                 max_block_transactions=MAX_BLOCK_TRANSACTIONS):
+        self.difficulty = difficulty  # Leading hex zeros, kept for the default target
+        self.target = target or target_from_bits(4 * difficulty)  # Initial bit-granular 256-bit target
+        self.retargeter = retargeter  # Optional retarget.Retargeter, otherwise the target is fixed
         self.chain = [self.create_genesis_block()]
-        self.difficulty = difficulty
-        self.pending_transactions = []
+        self.miner = miner  # Optional parallel nonce search engine
+        self.validator = validator  # Optional validator.ParallelValidator for whole-chain checks
+        self.pending_transactions = Mempool()  # Deduplicated, fee-ordered, size-capped
+        self.max_block_transactions = max_block_transactions  # Highest-fee transactions a new block takes
+        self.lock = threading.RLock()  # Held while the chain is extended, e.g. by the miner and by peers at once
 
     def create_genesis_block(self):
         """
         Creates the first block in the blockchain, called the 'genesis block'.
         """
-        return Block(0, "0" * 64, "Genesis Block", time.time())
+        return Block(0, "0" * 64, "Genesis Block", GENESIS_TIMESTAMP, target=self.target)
 
     def get_last_block(self):
         return self.chain[-1]
 
+    def expected_target(self, height, chain=None):
+        """
+        Returns the target a block at the given height of our chain (or of `chain`) must carry.
+        """
+        if self.retargeter is None or height == 0:
+            return self.target
+        return self.retargeter.next_target(self.chain if chain is None else chain, height)
+
+    def next_target(self):
+        """
+        Returns the target for the next block to be appended.
+        """
+        return self.expected_target(len(self.chain))
+
     def add_block(self, block):
         """
         Adds a block to the blockchain after validating it.
         """
-        previous_block = self.get_last_block()
-        if block.previous_hash == previous_block.hash and self.is_valid_block(block, previous_block):
+        with self.lock:
+            previous_block = self.get_last_block()
+            if block.previous_hash == previous_block.hash and self.is_valid_block(block, previous_block):
+                self.chain.append(block)
+                self.pending_transactions.remove_confirmed(block.data)
+            else:
+                raise Exception("Invalid block: failed to add to chain.")
+
+    def append_verified(self, block):
+        """
+        Appends a block that was already checked, e.g. by InitialSync against its
+        header chain, and drops its transactions from the pool.
+        """
+        with self.lock:
             self.chain.append(block)
-        else:
-            raise Exception("Invalid block: failed to add to chain.")
+            self.pending_transactions.remove_confirmed(block.data)
 
     def is_valid_block(self, block, previous_block):
         """
-        Validates a block by checking if its hash and previous hash match.
+        Validates the next block for the chain by checking its hash, its height, the target
+        for that height, its timestamp, its proof of work and the previous hash link.
         """
-        return (block.hash == block.compute_hash() and 
+        height = len(self.chain)
+        return (block.hash == block.compute_hash() and
+                block.index == height and
+                block.target == self.expected_target(height) and
+                timestamp_is_valid(block.timestamp, recent_timestamps(self.chain, height)) and
+                hash_meets_target(block.hash, block.target) and
                 block.previous_hash == previous_block.hash)
 
+    def is_chain_valid(self, chain=None):
+        """
+        Checks every block's hash, target, timestamp, proof of work and previous hash link.
+        """
+        return self.find_invalid_block(self.chain if chain is None else chain) is None
+
+    def find_invalid_block(self, chain, start=1):
+        """
+        Returns the height of the first invalid block in chain[start:], or None.
+        Every block must carry the target expected for its height, starting from
+        a genesis block with our initial target. With a validator the chain is
+        checked in parallel shards.
+        """
+        if start <= 1 and chain[0].target != self.target:
+            return 0
+        if self.validator is not None:
+            return self.validator.find_invalid_block(chain, start, self.target, self.retargeter)
+        start = max(start, 1)
+        previous_block = chain[start - 1]
+        recent = recent_timestamps(chain, start)
+        now = time.time()
+        for height in range(start, len(chain)):
+            current_block = chain[height]
+            if (current_block.hash != current_block.compute_hash() or
+                    current_block.target != self.expected_target(height, chain) or
+                    not timestamp_is_valid(current_block.timestamp, recent, now) or
+                    not hash_meets_target(current_block.hash, current_block.target) or
+                    current_block.previous_hash != previous_block.hash):
+                return height
+            recent.append(current_block.timestamp)
+            previous_block = current_block
+        return None
+
     def mine_pending_transactions(self, miner_address):
         """
-        Mines all pending transactions by creating a new block.
+        Mines the highest-fee pending transactions, up to max_block_transactions, into a new block.
         """
         if not self.pending_transactions:
             print("No transactions to mine.")
@@ -68,9 +245,10 @@ class Blockchain:
 
         new_block = Block(index=len(self.chain),
                           previous_hash=self.get_last_block().hash,
-                          data=self.pending_transactions)
-        new_block.mine_block(self.difficulty)
+                          data=self.pending_transactions.select(self.max_block_transactions),
+                          target=self.next_target())
+        new_block.mine_block(new_block.target, self.miner)
         self.add_block(new_block)
 
         # Reward the miner for mining the block
-        self.pending_transactions = [f"Reward to {miner_address}"]
+        self.pending_transactions.add(f"Reward to {miner_address}")
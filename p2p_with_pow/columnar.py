@@ -0,0 +1,112 @@
+from array import array
+
+from blockchain import Block
+
+
+class ColumnarChain:
+    def __init__(self, blocks=()):
+        """
+        List-like chain that keeps block headers in flat columns instead of one
+        Python object per block: raw 32-byte hashes in a bytearray, timestamps
+        and nonces in arrays. Block objects are only built when accessed.
+        previous_hash is not stored since it always equals the hash one row up.
+        """
+        self.genesis_previous_hash = None
+        self.hashes = bytearray()     # 32 bytes per block
+        self.targets = bytearray()    # 32 bytes per block, stored as target - 1 so 2^256 fits
+        self.timestamps = array("d")
+        self.nonces = array("Q")
+        self.data = []
+        for block in blocks:
+            self.append(block)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, block):
+        if len(self):
+            if block.previous_hash != self._hex_hash(len(self) - 1):
+                raise ValueError("Block does not extend the chain.")
+        else:
+            self.genesis_previous_hash = block.previous_hash
+        self.hashes += bytes.fromhex(block.hash)
+        self.targets += (block.target - 1).to_bytes(32, "big")
+        self.timestamps.append(block.timestamp)
+        self.nonces.append(block.nonce)
+        self.data.append(block.data)
+
+    def _hex_hash(self, height):
+        return self.hashes[height * 32:(height + 1) * 32].hex()
+
+    def _block(self, height):
+        previous_hash = self._hex_hash(height - 1) if height else self.genesis_previous_hash
+        target = int.from_bytes(self.targets[height * 32:(height + 1) * 32], "big") + 1
+        return Block(height, previous_hash, self.data[height], self.timestamps[height],
+                     self.nonces[height], target, self._hex_hash(height))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._block(height) for height in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Block height out of range.")
+        return self._block(item)
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self._block(height)
+
+
+def benchmark(blocks=100000):
+    """
+    Compares memory per block of the old __dict__-based Block, the __slots__
+    Block and ColumnarChain, using tracemalloc. The payload object is shared by
+    all blocks so only the per-block overhead is measured.
+    """
+    import hashlib
+    import tracemalloc
+
+    class DictBlock:  # Layout of Block before __slots__
+        def __init__(self, block):
+            self.index = block.index
+            self.previous_hash = block.previous_hash
+            self.data = block.data
+            self.timestamp = block.timestamp
+            self.nonce = block.nonce
+            self.target = block.target
+            self.hash = block.hash
+
+    payload = ["tx"]
+    previous_hash = bytes(32)
+    template = []
+    for height in range(blocks):
+        block_hash = hashlib.sha256(str(height).encode()).digest()
+        template.append((height, previous_hash, block_hash))
+        previous_hash = block_hash
+
+    def measure(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size / blocks
+
+    def build_blocks():
+        # Hex strings are created per block, as they are when blocks are mined or received
+        return [Block(height, previous_hash.hex(), payload, 1700000000.0 + height, height + 1000,
+                      1 << 240, block_hash.hex())
+                for height, previous_hash, block_hash in template]
+
+    results = {
+        "__dict__ Block": measure(lambda: [DictBlock(block) for block in build_blocks()]),
+        "__slots__ Block": measure(build_blocks),
+        "ColumnarChain": measure(lambda: ColumnarChain(build_blocks())),
+    }
+    for name, per_block in results.items():
+        print(f"{name:>16}: {per_block:8.1f} bytes/block")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,112 @@
+import hashlib
+import multiprocessing
+
+# Set in each worker process by the pool initializer; once any worker finds a
+# valid nonce it sets this so the others stop at their next chunk boundary.
+_found = None
+
+
+def _init_worker(found):
+    global _found
+    _found = found
+
+
+def _search(prefix, target, worker, workers, chunk_size):
+    """
+    Searches nonces worker*chunk_size .. in strides of workers*chunk_size until
+    a digest below `target` is found or the search is stopped. Returns
+    ((nonce, hash) or None, number of hashes tried).
+    """
+    midstate = hashlib.sha256(prefix.encode())  # Constant part of the block is hashed once
+    start = worker * chunk_size
+    stride = workers * chunk_size
+    attempts = 0
+    while not _found.is_set():
+        for nonce in range(start, start + chunk_size):
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            if int.from_bytes(attempt.digest(), 'big') < target:
+                _found.set()
+                return (nonce, attempt.hexdigest()), attempts + nonce - start + 1
+        attempts += chunk_size
+        start += stride
+    return None, attempts
+
+
+class ParallelMiner:
+    def __init__(self, workers=None, chunk_size=50000):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self._found = multiprocessing.Event()
+        self._pool = None
+        self.attempts = 0  # Hashes tried by the last mine() call
+
+    def mine(self, block, target, cancel=None):
+        """
+        Partitions the nonce space across the worker pool and returns the
+        (nonce, hash) pair found by the first worker to hit the target. If the
+        threading.Event `cancel` gets set first, the workers are stopped and
+        None is returned.
+        """
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                              initargs=(self._found,))
+        self._found.clear()
+        prefix = block.hash_prefix()
+        jobs = [self._pool.apply_async(_search, (prefix, target, worker, self.workers, self.chunk_size))
+                for worker in range(self.workers)]
+
+        if cancel is not None:
+            while not all(job.ready() for job in jobs):
+                if cancel.wait(0.05):
+                    self._found.set()  # Stops the workers like a found nonce would
+                    break
+
+        # Every worker returns within one chunk of the event being set, so
+        # waiting on all of them leaves the pool idle for the next block.
+        results = [job.get() for job in jobs]
+        self.attempts = sum(attempts for _, attempts in results)
+        found = [result for result, _ in results if result is not None]
+        return min(found) if found else None
+
+    def close(self):
+        """
+        Shuts down the worker pool.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def benchmark(payload_sizes=(100, 10000, 100000), attempts=20000):
+    """
+    Compares hashes/second of the full compute_hash() loop against the midstate
+    fast path for blocks carrying payloads of increasing size.
+    """
+    import time
+    from blockchain import Block
+
+    for size in payload_sizes:
+        block = Block(1, "0" * 64, ["x" * size])
+
+        start = time.perf_counter()
+        for nonce in range(attempts):
+            block.nonce = nonce
+            block.compute_hash()
+        full_rate = attempts / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        midstate = block.midstate()
+        for nonce in range(attempts):
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            int.from_bytes(attempt.digest(), 'big')
+        midstate_rate = attempts / (time.perf_counter() - start)
+
+        print(f"payload {size:>8} bytes: full {full_rate:>12,.0f} H/s | "
+              f"midstate {midstate_rate:>12,.0f} H/s | x{midstate_rate / full_rate:.1f}")
+
+
+if __name__ == "__main__":
+    benchmark()
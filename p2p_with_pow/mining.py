@@ -0,0 +1,139 @@
+import threading
+import time
+
+from blockchain import Block, hash_meets_target
+
+
+class MiningJobs:
+    def __init__(self, blockchain, on_block=None, refresh_transactions=10, max_transactions=None):
+        """
+        Mines blocks in a loop, each job working on a template built from the
+        current tip and the pending transactions. The running job is cancelled
+        as soon as the tip changes (a peer's block was added) or at least
+        `refresh_transactions` transactions arrived since the template was built,
+        and a fresh template is mined instead. Templates take the
+        `max_transactions` highest-fee transactions from the mempool (by default
+        the blockchain's max_block_transactions).
+        on_block(block) is called for every block this node adds.
+        """
+        self.blockchain = blockchain
+        self.on_block = on_block
+        self.refresh_transactions = refresh_transactions
+        self.max_transactions = max_transactions or blockchain.max_block_transactions
+        self.lock = threading.Lock()
+        self.job_lock = threading.Lock()  # One job at a time, from run() or a direct mine_one() call
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.cancel = None  # Event of the running job
+        self.template = None
+        self.template_pool_size = 0  # Pool size when the template was built; it may hold more than fit a block
+        self.abort_reason = None
+        self.metrics = {
+            "jobs": 0,
+            "blocks": 0,
+            "stale": 0,               # Found, but another block had already extended the tip
+            "aborted_tip": 0,         # Cancelled because the tip changed
+            "aborted_transactions": 0,
+            "hashes": 0,
+            "wasted_hashes": 0,       # Hashes spent on aborted jobs and stale blocks
+            "seconds": 0.0,
+            "wasted_seconds": 0.0,
+        }
+
+    def build_template(self):
+        tip = self.blockchain.get_last_block()
+        return Block(index=tip.index + 1, previous_hash=tip.hash,
+                     data=self.blockchain.pending_transactions.select(self.max_transactions),
+                     target=self.blockchain.next_target())
+
+    def _abort(self, reason):
+        with self.lock:
+            if self.cancel is not None and not self.cancel.is_set():
+                self.abort_reason = reason
+                self.cancel.set()
+        self.wakeup.set()
+
+    def tip_changed(self):
+        """
+        Call after a block from a peer was added: the running job now mines on a stale parent.
+        """
+        self._abort("tip")
+
+    def transactions_changed(self):
+        """
+        Call after transactions were added to the pool; restarts the job once enough are new.
+        """
+        with self.lock:
+            template = self.template
+        if template is None or (len(self.blockchain.pending_transactions) - self.template_pool_size
+                                >= self.refresh_transactions):
+            self._abort("transactions")
+
+    def stop(self):
+        self.stopped = True
+        self._abort("stop")
+
+    def mine_one(self):
+        """
+        Run one job on a fresh template. Returns the block if it was added to the
+        chain, or None if the job was cancelled before finding one or its block went stale.
+        """
+        with self.job_lock:
+            # The job's Event is registered before the tip is read for the template, so a
+            # tip_changed() in between cancels this job instead of the previous one
+            with self.lock:
+                self.cancel = threading.Event()
+                self.abort_reason = None
+                cancel = self.cancel
+            pool_size = len(self.blockchain.pending_transactions)
+            template = self.build_template()
+            with self.lock:
+                self.template = template
+                self.template_pool_size = pool_size
+            self.metrics["jobs"] += 1
+
+            start = time.perf_counter()
+            hashes = template.mine_block(template.target, self.blockchain.miner, cancel)
+            elapsed = time.perf_counter() - start
+            self.metrics["hashes"] += hashes
+            self.metrics["seconds"] += elapsed
+
+            if not hash_meets_target(template.hash, template.target):
+                if self.abort_reason in ("tip", "transactions"):
+                    self.metrics["aborted_" + self.abort_reason] += 1
+                self.metrics["wasted_hashes"] += hashes
+                self.metrics["wasted_seconds"] += elapsed
+                return None
+            # A found block is kept even if the job was cancelled after it, as long as its parent is still the tip
+            try:
+                if template.previous_hash != self.blockchain.get_last_block().hash:
+                    raise ValueError("Stale block")
+                self.blockchain.add_block(template)
+            except Exception:
+                self.metrics["stale"] += 1
+                self.metrics["wasted_hashes"] += hashes
+                self.metrics["wasted_seconds"] += elapsed
+                return None
+            self.metrics["blocks"] += 1
+        if self.on_block is not None:
+            self.on_block(template)
+        return template
+
+    def run(self):
+        """
+        Mining loop; returns after stop(). Idles while there is nothing to mine.
+        """
+        while not self.stopped:
+            self.wakeup.clear()
+            if not self.blockchain.pending_transactions:
+                self.wakeup.wait(1.0)
+                continue
+            self.mine_one()
+
+    def report(self):
+        metrics = self.metrics
+        wasted = metrics["wasted_hashes"] / metrics["hashes"] if metrics["hashes"] else 0.0
+        return (f"{metrics['jobs']} jobs, {metrics['blocks']} blocks, {metrics['stale']} stale, "
+                f"aborted {metrics['aborted_tip']} on new tip / {metrics['aborted_transactions']} on new "
+                f"transactions, {wasted:.1%} of {metrics['hashes']:,} hashes wasted "
+                f"({metrics['wasted_seconds']:.1f}s of {metrics['seconds']:.1f}s)")
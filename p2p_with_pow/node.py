@@ -1,7 +1,10 @@
-import socket
-import threading
-import json
-from blockchain import Blockchain, Block
+from blockchain import hash_meets_target
+from mining import MiningJobs
+from peer import ConnectionPool
+from server import AsyncServer
+from sync import InitialSync, serve_sync_request
+from wire import (MSG_BLOCK, MSG_GETBLOCKS, MSG_GETHEADERS, MSG_TRANSACTION, decode_message,
+                  encode_message)
 
 class Node:
     def __init__(self, host, port, blockchain):
@@ -9,60 +12,43 @@ class Node:
         self.port = port
         self.blockchain = blockchain
         self.peers = []
-        
-    def start(self):
-        """
-        Starts the node's server and begins listening for peer connections.
-        """
-        server_thread = threading.Thread(target=self.start_server)
-        server_thread.start()
+        self.pool = ConnectionPool()  # One persistent framed connection per peer
+        self.server = None
+        self.mining = MiningJobs(self.blockchain, on_block=self.broadcast_block)  # Jobs for mine_block() and start_mining()
 
-    def start_server(self):
+    def start(self):
         """
-        Start a server socket to listen for incoming peer connections.
+        Starts the node's asyncio server, which handles every peer connection from one event loop.
         """
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind((self.host, self.port))
-        server_socket.listen(5)
+        self.server = AsyncServer(self.host, self.port, self.handle_message)
+        self.server.start()
         print(f"Node started at {self.host}:{self.port}. Waiting for connections...")
 
-        while True:
-            conn, addr = server_socket.accept()
-            threading.Thread(target=self.handle_peer, args=(conn, addr)).start()
-
-    def handle_peer(self, conn, addr):
-        """
-        Handles the connection with a peer, and processes incoming data (blocks or transactions).
-        """
-        print(f"Connected by {addr}")
-        data = conn.recv(1024).decode()
-        if data:
-            self.handle_message(data, conn)
-        conn.close()
-
     def handle_message(self, message, conn):
         """
-        Processes messages (blocks, transactions) sent by peers.
+        Processes a framed message (block, transaction, sync request) sent by a peer. Runs on the
+        server's event loop.
         """
         try:
-            message = json.loads(message)
-            if message['type'] == 'block':
-                self.receive_block(message['block'])
-            elif message['type'] == 'transaction':
-                self.receive_transaction(message['transaction'])
+            kind, value = decode_message(message)
+            if kind in (MSG_GETHEADERS, MSG_GETBLOCKS):
+                serve_sync_request(self.blockchain, kind, value, conn)
+            elif kind == MSG_BLOCK:
+                self.receive_block(value)
+            elif kind == MSG_TRANSACTION:
+                self.receive_transaction(value)
         except Exception as e:
             print(f"Error processing message: {e}")
 
-    def receive_block(self, block_data):
+    def receive_block(self, new_block):
         """
         Receives a new block from a peer, validates its PoW, and adds it to the blockchain.
         """
-        new_block = Block(block_data['index'], block_data['previous_hash'], block_data['data'], 
-                          block_data['timestamp'], block_data['nonce'])
-        if new_block.compute_hash() == new_block.hash and new_block.hash.startswith('0' * self.blockchain.difficulty):
+        if new_block.compute_hash() == new_block.hash and hash_meets_target(new_block.hash, new_block.target):
             try:
                 self.blockchain.add_block(new_block)
                 print(f"Block added to the chain: {new_block.hash}")
+                self.mining.tip_changed()
             except Exception as e:
                 print(f"Block validation failed: {e}")
         else:
@@ -72,69 +58,63 @@ class Node:
         """
         Receives a transaction and adds it to the pending transactions.
         """
-        self.blockchain.pending_transactions.append(transaction)
+        if not self.blockchain.pending_transactions.add(transaction):
+            return  # Already pooled, or evicted for its low fee
         print(f"Transaction received: {transaction}")
+        self.mining.transactions_changed()
+
+    def sync(self):
+        """
+        Initial block download: fetch whatever our peers have above our tip.
+        """
+        appended, rate = InitialSync(self.blockchain, self.peers).run()
+        print(f"Synced {appended} blocks from peers ({rate:.0f} blocks/s)")
+        if appended:
+            self.mining.tip_changed()
+
+    def start_mining(self):
+        """
+        Runs the mining job manager in the server's executor so the event loop keeps serving
+        peers. Jobs restart whenever a peer's block or enough new transactions arrive.
+        """
+        return self.server.run_in_executor(self.mining.run)
 
     def mine_block(self, miner_address):
         """
         Mines a new block, adds it to the blockchain, and broadcasts it to peers.
+        Runs as one MiningJobs job, so a peer's block arriving meanwhile cancels
+        the search; returns the block, or None if it was cancelled or went stale.
         """
         print("Mining a new block...")
         if not self.blockchain.pending_transactions:
             print("No transactions to mine.")
-            return
-
-        # Mine the block with pending transactions
-        last_block = self.blockchain.get_last_block()
-        new_block = Block(index=last_block.index + 1,
-                          previous_hash=last_block.hash,
-                          data=self.blockchain.pending_transactions)
-        
-        new_block.mine_block(self.blockchain.difficulty)
-
-        # Add the mined block to the blockchain
-        self.blockchain.add_block(new_block)
-
-        # Clear the pending transactions (since they've been added to the mined block)
-        self.blockchain.pending_transactions = []
-
-        # Broadcast the mined block to peers
-        self.broadcast_block(new_block)
+            return None
+        return self.mining.mine_one()
 
     def broadcast_block(self, block):
         """
         Broadcasts the new block to all connected peers.
         """
-        message = json.dumps({"type": "block", "block": block.__dict__})
-        self.send_to_peers(message)
+        self.send_to_peers(encode_message(MSG_BLOCK, block))
 
     def broadcast_transaction(self, transaction):
         """
         Broadcasts a transaction to all connected peers.
         """
-        message = json.dumps({"type": "transaction", "transaction": transaction})
-        self.send_to_peers(message)
+        self.send_to_peers(encode_message(MSG_TRANSACTION, transaction))
 
     def send_to_peers(self, message):
         """
-        Sends a message to all connected peers.
+        Queues a message for all connected peers without waiting on a slow one.
         """
-        for peer in self.peers:
-            try:
-                peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                peer_socket.connect(peer)
-                peer_socket.sendall(message.encode())
-                peer_socket.close()
-            except Exception as e:
-                print(f"Error sending message to peer {peer}: {e}")
+        self.pool.relay(message, self.peers)
 
     def connect_to_peer(self, peer_host, peer_port):
         """
-        Connects to a peer and adds it to the list of peers.
+        Connects to a peer and adds it to the list of peers. The connection stays open for later messages.
         """
         try:
-            peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            peer_socket.connect((peer_host, peer_port))
+            self.pool.get((peer_host, peer_port)).open()
             self.peers.append((peer_host, peer_port))
             print(f"Connected to peer at {peer_host}:{peer_port}")
         except Exception as e:
@@ -1,8 +1,17 @@
 from blockchain import Blockchain
+from columnar import ColumnarChain
+from miner import ParallelMiner
 from node import Node
+from retarget import Retargeter
+from validator import ParallelValidator
 
-def run_node(host, port, peer_host=None, peer_port=None):
-    blockchain = Blockchain(difficulty=4)
+def run_node(host, port, peer_host=None, peer_port=None, workers=None):
+    # difficulty=4 is only the starting point; the target is retuned every 10 blocks
+    # towards one block every 10 seconds
+    blockchain = Blockchain(difficulty=4, miner=ParallelMiner(workers),
+                            retargeter=Retargeter(block_time=10.0, interval=10),
+                            validator=ParallelValidator(workers))
+    blockchain.chain = ColumnarChain(blockchain.chain)  # Headers in flat columns, not one object per block
     node = Node(host, port, blockchain)
 
     # Start the node server
@@ -11,6 +20,7 @@ def run_node(host, port, peer_host=None, peer_port=None):
     # Optionally connect to a peer
     if peer_host and peer_port:
         node.connect_to_peer(peer_host, peer_port)
+        node.sync()  # Catch up on the peer's chain before mining on top of it
 
 if __name__ == "__main__":
     import sys
@@ -18,5 +28,6 @@ if __name__ == "__main__":
     port = int(sys.argv[2])  # e.g., 5000
     peer_host = sys.argv[3] if len(sys.argv) > 3 else None
     peer_port = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    workers = int(sys.argv[5]) if len(sys.argv) > 5 else None  # Mining processes, defaults to CPU count
 
-    run_node(host, port, peer_host, peer_port)
+    run_node(host, port, peer_host, peer_port, workers)
@@ -0,0 +1,250 @@
+import queue
+import socket
+import threading
+import time
+
+from blockchain import ForkView, block_work, hash_meets_target, recent_timestamps, timestamp_is_valid
+from peer import recv_frame, send_frame
+from wire import (MSG_BLOCKS, MSG_GETBLOCKS, MSG_GETHEADERS, MSG_HEADERS, decode_message,
+                  encode_message)
+
+MAX_HEADERS = 2000  # Largest range a node answers in one MSG_HEADERS / MSG_BLOCKS
+MAX_BLOCKS = 500
+
+
+class SyncPeer:
+    def __init__(self, address, timeout=10.0):
+        """
+        Request/response connection used during sync; replies arrive on the same socket.
+        """
+        self.address = address
+        self.sock = socket.create_connection(address, timeout=timeout)
+
+    def request(self, kind, value, reply_kind):
+        send_frame(self.sock, encode_message(kind, value))
+        frame = recv_frame(self.sock)
+        if frame is None:
+            raise ConnectionError(f"Peer {self.address} closed the connection.")
+        kind, value = decode_message(frame)
+        if kind != reply_kind:
+            raise ValueError(f"Unexpected reply type {kind} from {self.address}.")
+        return value
+
+    def headers(self, start):
+        """
+        Returns every header the peer has from `start` on.
+        """
+        headers = []
+        while True:
+            batch = self.request(MSG_GETHEADERS, [start + len(headers), MAX_HEADERS], MSG_HEADERS)
+            headers += batch
+            if len(batch) < MAX_HEADERS:
+                return headers
+
+    def blocks(self, start, count):
+        return self.request(MSG_GETBLOCKS, [start, count], MSG_BLOCKS)
+
+    def close(self):
+        self.sock.close()
+
+
+class InitialSync:
+    def __init__(self, blockchain, peers, batch_size=MAX_BLOCKS, timeout=10.0):
+        """
+        Headers-first initial block download. Headers above our tip are fetched
+        from every peer and the valid header chain with the most work is chosen;
+        block bodies are then fetched in `batch_size` ranges from all peers in
+        parallel, checked against the chosen headers as they arrive and
+        appended in height order.
+        """
+        self.blockchain = blockchain
+        self.addresses = list(peers)
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+    def valid_headers(self, headers):
+        """
+        Returns the longest prefix of `headers` that links onto our tip and carries
+        correct heights, targets, timestamps and proof of work (hashes are checked
+        against the bodies later).
+        """
+        chain = self.blockchain.chain
+        view = ForkView(chain, len(chain), headers)
+        previous_hash = chain[-1].hash
+        recent = recent_timestamps(chain, len(chain))
+        now = time.time()
+        for position, header in enumerate(headers):
+            height = len(chain) + position
+            if (header.index != height or header.previous_hash != previous_hash or
+                    header.target != self.blockchain.expected_target(height, view) or
+                    not timestamp_is_valid(header.timestamp, recent, now) or
+                    not hash_meets_target(header.hash, header.target)):
+                return headers[:position]
+            recent.append(header.timestamp)
+            previous_hash = header.hash
+        return headers
+
+    def run(self):
+        """
+        Syncs to the best peer chain; returns (blocks appended, blocks/sec). When
+        the peer whose headers were chosen cannot back them with bodies, its
+        headers are thrown away and sync starts over from our new tip without it.
+        """
+        start_time = time.perf_counter()
+        appended = 0
+        excluded = set()
+        while True:
+            count, faulty = self.sync_round(excluded)
+            appended += count
+            if faulty is None:
+                break
+            print(f"Dropping sync peer {faulty}: its headers do not match the blocks it serves")
+            excluded.add(faulty)
+        elapsed = time.perf_counter() - start_time
+        return appended, appended / elapsed if elapsed else 0.0
+
+    def sync_round(self, excluded):
+        """
+        Fetches headers from every peer not in `excluded`, then the bodies of the
+        header chain with the most work. Returns (blocks appended, address of
+        the peer whose headers turned out fake, or None).
+        """
+        peers = []
+        best_headers, best_work, source = [], 0, None
+        for address in self.addresses:
+            if address in excluded:
+                continue
+            try:
+                peer = SyncPeer(address, self.timeout)
+                headers = self.valid_headers(peer.headers(len(self.blockchain.chain)))
+            except (OSError, ValueError) as e:
+                print(f"Skipping sync peer {address}: {e}")
+                continue
+            peers.append(peer)
+            work = sum(block_work(header.target) for header in headers)
+            if work > best_work:
+                best_headers, best_work, source = headers, work, peer
+        if not best_headers:
+            for peer in peers:
+                peer.close()
+            return 0, None
+
+        base = len(self.blockchain.chain)
+        batches = queue.Queue()
+        for start in range(0, len(best_headers), self.batch_size):
+            batches.put((base + start, min(self.batch_size, len(best_headers) - start)))
+        arrived = {}  # start height -> blocks, filled by the fetch threads
+        condition = threading.Condition()
+        active = [len(peers)]
+        remaining = [batches.qsize()]  # Ranges not fetched yet; failed ones are put back
+        fake = [False]  # Set once the source of best_headers fails to serve matching bodies
+
+        def fetch(peer):
+            try:
+                while not fake[0]:
+                    try:
+                        start, count = batches.get(timeout=0.1)
+                    except queue.Empty:
+                        if not remaining[0]:
+                            return
+                        continue  # A range in flight on another peer may still be put back
+                    try:
+                        blocks = peer.blocks(start, count)
+                        if len(blocks) != count:
+                            raise ValueError("Incomplete block range.")
+                        for offset, block in enumerate(blocks):
+                            if block.compute_hash() != block.hash:
+                                raise ValueError(f"Block {start + offset} does not match its hash.")
+                        # Bodies must hash to the headers already accepted. A peer on
+                        # another chain is only left out of this round, since it may be
+                        # the headers that are fake; their source must back them itself.
+                        for offset, block in enumerate(blocks):
+                            if block.hash != best_headers[start - base + offset].hash:
+                                if peer is source:
+                                    with condition:
+                                        fake[0] = True
+                                        condition.notify()
+                                    return
+                                print(f"Sync peer {peer.address} is not on the chosen header chain")
+                                batches.put((start, count))
+                                return
+                    except OSError as e:
+                        print(f"Dropping sync peer {peer.address}: {e}")
+                        batches.put((start, count))  # Another peer will fetch the range
+                        return
+                    except ValueError as e:
+                        print(f"Dropping sync peer {peer.address}: {e}")
+                        if peer is source:
+                            with condition:
+                                fake[0] = True
+                                condition.notify()
+                        else:
+                            batches.put((start, count))
+                        return
+                    with condition:
+                        arrived[start] = blocks
+                        remaining[0] -= 1
+                        condition.notify()
+            finally:
+                peer.close()
+                with condition:
+                    active[0] -= 1
+                    condition.notify()
+
+        for peer in peers:
+            threading.Thread(target=fetch, args=(peer,), daemon=True).start()
+
+        appended = 0
+        while appended < len(best_headers):
+            with condition:
+                while base + appended not in arrived and active[0] and not fake[0]:
+                    condition.wait()
+                blocks = None if fake[0] else arrived.pop(base + appended, None)
+            if blocks is None:
+                break  # Every peer failed before the next range arrived, or the headers are fake
+            for block in blocks:
+                self.blockchain.append_verified(block)
+            appended += len(blocks)
+        return appended, source.address if fake[0] else None
+
+
+def serve_sync_request(blockchain, kind, value, conn):
+    """
+    Answers MSG_GETHEADERS / MSG_GETBLOCKS on the connection the request came in on.
+    """
+    start, count = value
+    if kind == MSG_GETHEADERS:
+        conn.send(encode_message(MSG_HEADERS, blockchain.chain[start:start + min(count, MAX_HEADERS)]))
+    else:
+        conn.send(encode_message(MSG_BLOCKS, blockchain.chain[start:start + min(count, MAX_BLOCKS)]))
+
+
+def benchmark(blocks=100000, peers=3):
+    """
+    Syncs a fresh node from `peers` local stand-in nodes that all serve the
+    same `blocks`-block chain and reports blocks/sec.
+    """
+    from blockchain import GENESIS_TIMESTAMP, Block, Blockchain
+    from node import Node
+
+    source = Blockchain(difficulty=1)
+    for height in range(1, blocks):
+        block = Block(height, source.get_last_block().hash, [f"tx {height}"], GENESIS_TIMESTAMP + height,
+                      target=source.next_target())
+        block.mine_block(block.target)
+        source.append_verified(block)
+
+    nodes = [Node("127.0.0.1", 0, source) for _ in range(peers)]
+    for node in nodes:
+        node.start()
+
+    fresh = Blockchain(difficulty=1)
+    appended, rate = InitialSync(fresh, [("127.0.0.1", node.server.port) for node in nodes]).run()
+    for node in nodes:
+        node.server.stop()
+    assert len(fresh.chain) == blocks and fresh.chain[-1].hash == source.chain[-1].hash
+    print(f"synced {appended:,} blocks from {peers} peers: {rate:,.0f} blocks/s")
+
+
+if __name__ == "__main__":
+    benchmark()
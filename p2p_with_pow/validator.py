@@ -0,0 +1,176 @@
+import multiprocessing
+import time
+
+from blockchain import MEDIAN_TIME_BLOCKS, hash_meets_target, recent_timestamps, timestamp_is_valid
+
+# The chain being validated and how its targets are set, handed to each worker
+# by the pool initializer. Workers are started fresh (forkserver or spawn), not
+# forked from a process whose other threads may hold locks; a stored chain is
+# pickled as its path and reopened read-only in the worker, while an in-memory
+# chain is sent shard by shard instead.
+_chain = None
+_target = None
+_retargeter = None
+
+
+def _init_worker(chain, target, retargeter):
+    global _chain, _target, _retargeter
+    _chain, _target, _retargeter = chain, target, retargeter
+
+
+def expected_target(chain, height, target, retargeter):
+    """
+    Returns the target the block at `height` must carry, as Blockchain.expected_target does.
+    """
+    if retargeter is None or height == 0:
+        return target
+    return retargeter.next_target(chain, height)
+
+
+class ChainSlice:
+    def __init__(self, offset, blocks):
+        """
+        chain[offset:offset + len(blocks)], still indexed by height, so a worker
+        can check a shard of an in-memory chain without receiving all of it.
+        """
+        self.offset = offset
+        self.blocks = blocks
+
+    def __len__(self):
+        return self.offset + len(self.blocks)
+
+    def __getitem__(self, height):
+        if height < self.offset:
+            raise IndexError(f"Height {height} is below this slice of the chain.")
+        return self.blocks[height - self.offset]
+
+
+def check_range(chain, start, stop, target=None, retargeter=None):
+    """
+    Returns the first height in [start, stop) whose hash, proof of work,
+    timestamp or link to the block before it inside the range is wrong, or
+    None. With `target` (the chain's initial target) every block must also
+    carry the target expected for its height.
+    """
+    previous_block = None
+    recent = recent_timestamps(chain, start)
+    now = time.time()
+    for height in range(start, stop):
+        block = chain[height]
+        if block.hash != block.compute_hash() or not hash_meets_target(block.hash, block.target):
+            return height
+        if not timestamp_is_valid(block.timestamp, recent, now):
+            return height
+        recent.append(block.timestamp)
+        if target is not None and block.target != expected_target(chain, height, target, retargeter):
+            return height
+        if previous_block is not None and block.previous_hash != previous_block.hash:
+            return height
+        previous_block = block
+    return None
+
+
+def _check_shard(shard):
+    low, high, blocks = shard
+    return check_range(_chain if blocks is None else blocks, low, high, _target, _retargeter)
+
+
+def pool_context():
+    """
+    The forkserver start method where the platform has it, otherwise spawn.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class ParallelValidator:
+    def __init__(self, workers=None, shard_size=None, min_parallel=200000):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.shard_size = shard_size  # Defaults to about four shards per worker
+        # Starting the workers costs about as much as validating 100k-200k blocks
+        # serially (see benchmark()), so shorter ranges are validated in process
+        self.min_parallel = min_parallel
+
+    def shards(self, start, end):
+        shard_size = self.shard_size or max(1, -(-(end - start) // (self.workers * 4)))
+        return [(low, min(low + shard_size, end)) for low in range(start, end, shard_size)]
+
+    def shard_tasks(self, chain, shards, retargeter):
+        """
+        Yield the work items for the shards. A stored chain is reopened by each
+        worker, so only the heights are sent; otherwise each shard carries its
+        blocks and the ones before it that its timestamps and targets depend on.
+        """
+        if hasattr(chain, "store"):
+            for low, high in shards:
+                yield low, high, None
+            return
+        lookback = max(MEDIAN_TIME_BLOCKS, getattr(retargeter, "interval", 0))
+        for low, high in shards:
+            first = max(low - lookback, 0)
+            yield low, high, ChainSlice(first, [chain[height] for height in range(first, high)])
+
+    def find_invalid_block(self, chain, start=1, target=None, retargeter=None, end=None):
+        """
+        Returns the height of the first invalid block in chain[start:end], or None.
+        Shards are verified independently by the workers; only the previous_hash
+        links across shard boundaries are checked here. `target` and `retargeter`
+        are passed on to check_range.
+        """
+        start = max(start, 1)
+        end = len(chain) if end is None else end
+        if end - start < self.min_parallel or self.workers < 2:
+            if start < end and chain[start].previous_hash != chain[start - 1].hash:
+                return start
+            return check_range(chain, start, end, target, retargeter)
+        shards = self.shards(start, end)
+        stored = chain if hasattr(chain, "store") else None
+        with pool_context().Pool(self.workers, initializer=_init_worker, initargs=(stored, target, retargeter)) as pool:
+            # imap yields in shard order, so the first failure seen is the lowest height
+            tasks = self.shard_tasks(chain, shards, retargeter)
+            for (low, _), invalid in zip(shards, pool.imap(_check_shard, tasks)):
+                if chain[low].previous_hash != chain[low - 1].hash:
+                    return low
+                if invalid is not None:
+                    return invalid
+        return None
+
+
+def benchmark(blocks=20000, workers=None):
+    """
+    Times full validation of a freshly mined chain serially and with
+    ParallelValidator. Blocks are mined at an easy target so building the chain
+    stays quick; validation cost is dominated by recomputing the hashes.
+    """
+    from blockchain import GENESIS_TIMESTAMP, Block, MAX_TARGET
+
+    chain = [Block(0, "0", "Genesis Block", GENESIS_TIMESTAMP)]
+    for height in range(1, blocks):
+        block = Block(height, chain[-1].hash, [f"tx {height}"], GENESIS_TIMESTAMP + height)
+        block.mine_block(MAX_TARGET >> 4)
+        chain.append(block)
+
+    start = time.perf_counter()
+    serial = check_range(chain, 1, blocks)
+    serial_time = time.perf_counter() - start
+
+    validator = ParallelValidator(workers, min_parallel=0)
+    start = time.perf_counter()
+    parallel = validator.find_invalid_block(chain)
+    parallel_time = time.perf_counter() - start
+
+    # Pool start-up alone, for choosing min_parallel
+    start = time.perf_counter()
+    with pool_context().Pool(validator.workers, initializer=_init_worker, initargs=([], None, None)) as pool:
+        pool.map(abs, range(validator.workers))
+    startup_time = time.perf_counter() - start
+
+    assert serial is None and parallel is None
+    print(f"serial: {blocks / serial_time:,.0f} blocks/s | "
+          f"{validator.workers} workers: {blocks / parallel_time:,.0f} blocks/s | "
+          f"pool start-up {startup_time * 1e3:.0f} ms = {startup_time * blocks / serial_time:,.0f} serial blocks")
+
+
+if __name__ == "__main__":
+    benchmark()